@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## atomindex.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Atom table (compound, atom, type, match, group) of
+##   substructure_generate_fulltable.py as a binary file sorted by compound,
+##   with an index of the rows of each compound, so that the rows of a few
+##   compounds can be read from a large mechanism without reading the whole
+##   table. The file is memory-mapped; rows of a compound are a view of the
+##   file (no copy), found by binary search among compound names.
+##
+## Layout: magic string, length of header (uint64), header (JSON: number of
+##   compounds and rows, atom types, groups, and the offset of each array),
+##   and arrays aligned to 64 bytes:
+##     names   - compound names (utf-8, fixed width), sorted
+##     offset  - first row of each compound (int64)
+##     length  - number of rows of each compound (int64)
+##     rows    - records (compound, atom, type, match, group) of int32; type
+##               and group are codes into the header lists, compound is the
+##               position in names, and missing values are -1
+##   Rows of a compound are in the order of the atom table.
+
+import io
+import json
+import struct
+import pickle
+import tempfile
+from collections import OrderedDict
+from lazyimport import lazyimport
+
+np = lazyimport('numpy')
+pd = lazyimport('pandas')
+
+magic = b'APRLATX1'
+extension = '.bin'
+alignment = 64
+
+rowtype = [('compound','<i4'),('atom','<i4'),('type','<i4'),('match','<i4'),('group','<i4')]
+
+def isatomindex(filename):
+    try:
+        with open(filename,'rb') as f:
+            return f.read(len(magic))==magic
+    except (IOError, OSError):
+        return False
+
+def _codes(values):
+    ## int32 codes of values and labels (str), -1 for missing
+    codes, labels = pd.factorize(values)
+    return codes.astype(np.int32), np.asarray(labels,dtype=object).astype(str)
+
+def _integers(values):
+    ## int32 values, -1 for missing
+    values = pd.to_numeric(pd.Series(values)).values
+    return np.where(pd.isnull(values),-1,values).astype(np.int32)
+
+###_* --- Writing
+
+class atomindexwriter:
+
+    ## writes atom tables (DataFrames with the columns of
+    ##   substructure_generate_fulltable.py) one chunk at a time. Chunks are
+    ##   spooled to a temporary file as compact arrays, since the names of
+    ##   compounds, types and groups are only known after the last chunk;
+    ##   rows are sorted by compound when closed.
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.spool = tempfile.TemporaryFile()
+        self.nchunks = 0
+
+    def write(self,df):
+        compound, compounds = _codes(df['compound'].values)
+        typ, types = _codes(df['type'].values)
+        group, groups = _codes(df['group'].values)
+        chunk = (compounds, compound, _integers(df['atom']), types, typ,
+                 _integers(df['match']), groups, group)
+        pickle.dump(chunk,self.spool,pickle.HIGHEST_PROTOCOL)
+        self.nchunks += 1
+
+    def close(self):
+        self.spool.seek(0)
+        chunks = [pickle.load(self.spool) for i in range(self.nchunks)]
+        self.spool.close()
+        names = [np.unique(np.concatenate([x[k] for x in chunks] or [np.array([],dtype=str)]))
+                 for k in (0,3,6)]
+        rows = np.empty(sum(len(x[1]) for x in chunks),dtype=rowtype)
+        ## codes within chunks to codes in names
+        recode = lambda codes, labels, k: np.where(
+            codes < 0, -1, np.searchsorted(names[k],labels)[np.maximum(codes,0)] if len(labels) else -1)
+        i = 0
+        for compounds, compound, atom, types, typ, match, groups, group in chunks:
+            n = len(compound)
+            rows['compound'][i:i+n] = recode(compound,compounds,0)
+            rows['atom'][i:i+n] = atom
+            rows['type'][i:i+n] = recode(typ,types,1)
+            rows['match'][i:i+n] = match
+            rows['group'][i:i+n] = recode(group,groups,2)
+            i += n
+        rows = rows[np.argsort(rows['compound'],kind='mergesort')]
+        writeindex(self.filename,names[0],rows,list(names[1]),list(names[2]))
+
+def writeindex(filename,compounds,rows,types,groups):
+    ## compounds are sorted names; rows are sorted by compound code
+    encoded = np.array([x.encode('utf-8') for x in compounds],
+                       dtype='S{:d}'.format(max([len(x.encode('utf-8')) for x in compounds] or [1])))
+    length = np.bincount(rows['compound'],minlength=len(compounds)).astype(np.int64)
+    offset = np.concatenate([[0],np.cumsum(length)[:-1]]).astype(np.int64)
+    arrays = OrderedDict([('names',encoded),('offset',offset),('length',length),('rows',rows)])
+    header = OrderedDict([
+        ('ncompounds',len(compounds)),
+        ('nrows',len(rows)),
+        ('types',types),
+        ('groups',groups),
+        ('arrays',OrderedDict()),
+        ])
+    ## offsets of arrays depend on the length of the header, which is
+    ##   padded to a fixed size once it is known
+    size = len(json.dumps(header))+len(arrays)*200+alignment
+    start = len(magic)+8+size
+    for k, x in arrays.items():
+        start += -start % alignment
+        header['arrays'][k] = OrderedDict([('offset',start),('dtype',x.dtype.descr if x.dtype.names else x.dtype.str),('shape',len(x))])
+        start += x.nbytes
+    text = json.dumps(header).encode('utf-8')
+    if len(text) > size:
+        raise ValueError('header of {} exceeds reserved size'.format(filename))
+    with open(filename,'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<Q',size))
+        f.write(text.ljust(size,b' '))
+        for k, x in arrays.items():
+            f.write(b'\0'*(header['arrays'][k]['offset']-f.tell()))
+            f.write(x.tobytes())
+
+def writeatomtable(fulltable,filename):
+    ## write a whole atom table (see atomindexwriter)
+    writer = atomindexwriter(filename)
+    writer.write(fulltable)
+    writer.close()
+
+###_* --- Reading
+
+def _dtype(descr):
+    return np.dtype([tuple(x) for x in descr]) if isinstance(descr,list) else np.dtype(descr)
+
+class atomindex:
+
+    ## memory-mapped atom table. atomindex(filename)[compound] is the array
+    ##   of rows (rowtype) of a compound, a view of the file; table() returns
+    ##   rows of any compounds as the DataFrame read from the atom table of
+    ##   substructure_generate_fulltable.py.
+
+    def __init__(self,filename):
+        with open(filename,'rb') as f:
+            if f.read(len(magic))!=magic:
+                raise ValueError('{} is not an atom index file'.format(filename))
+            size, = struct.unpack('<Q',f.read(8))
+            header = json.loads(f.read(size).decode('utf-8'))
+        self.filename = filename
+        self.types = header['types']
+        self.groups = header['groups']
+        self.buffer = np.memmap(filename,dtype=np.uint8,mode='r')
+        for k, x in header['arrays'].items():
+            dtype = _dtype(x['dtype'])
+            setattr(self,k,self.buffer[x['offset']:x['offset']+dtype.itemsize*x['shape']].view(dtype))
+
+    def __len__(self):
+        return len(self.names)
+
+    def compounds(self):
+        return pd.Index([x.decode('utf-8') for x in self.names],name='compound')
+
+    def position(self,compound):
+        ## position of compound among names, or -1 if absent
+        key = compound.encode('utf-8')
+        i = int(np.searchsorted(self.names,key))
+        return i if i < len(self.names) and self.names[i]==key else -1
+
+    def slice(self,compound):
+        ## (offset, length) of rows of compound; length is 0 if absent
+        i = self.position(compound)
+        if i < 0:
+            return 0, 0
+        return int(self.offset[i]), int(self.length[i])
+
+    def __getitem__(self,compound):
+        offset, length = self.slice(compound)
+        return self.rows[offset:offset+length]
+
+    def __contains__(self,compound):
+        return self.position(compound) >= 0
+
+    def select(self,compounds=None):
+        ## rows of compounds (all if None), in order of compound names. A
+        ##   view if the compounds are consecutive; copied otherwise
+        if compounds is None:
+            return self.rows
+        if isinstance(compounds,str):
+            compounds = [compounds]
+        positions = sorted(set(i for i in map(self.position,compounds) if i >= 0))
+        if not positions:
+            return self.rows[:0]
+        if positions[-1]-positions[0]==len(positions)-1:
+            start = self.offset[positions[0]]
+            return self.rows[start:self.offset[positions[-1]]+self.length[positions[-1]]]
+        return np.concatenate([self.rows[self.offset[i]:self.offset[i]+self.length[i]] for i in positions])
+
+    def table(self,compounds=None):
+        ## DataFrame of rows of compounds (all if None). compound, type and
+        ##   group are categorical; atom and match are floats with NaN if
+        ##   any value is missing
+        rows = self.select(compounds)
+        present = np.unique(rows['compound'])
+        names = [x.decode('utf-8') for x in self.names[present]]
+        columns = OrderedDict()
+        columns['compound'] = pd.Categorical.from_codes(np.searchsorted(present,rows['compound']),names)
+        columns['atom'] = self.__integers(rows['atom'])
+        columns['type'] = pd.Categorical.from_codes(rows['type'],self.types)
+        columns['match'] = self.__integers(rows['match'])
+        columns['group'] = pd.Categorical.from_codes(rows['group'],self.groups)
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def __integers(values):
+        if (values < 0).any():
+            return np.where(values < 0,np.nan,values)
+        return values.astype(np.int64)
+
+def readatomtable(filename,compounds=None):
+    ## atom table of substructure_generate_fulltable.py in any format,
+    ##   restricted to compounds if given; only the rows of these compounds
+    ##   are read from atom index files
+    if isatomindex(filename):
+        return atomindex(filename).table(compounds)
+    from tableio import readtable
+    table = readtable(filename)
+    if compounds is not None:
+        table = table.loc[table['compound'].isin(compounds)].reset_index(drop=True)
+    return table
+
+def readcompounds(filename):
+    ## list of compounds in a single column
+    with io.open(filename) as f:
+        return [x.strip('"\'\n') for x in f if x.strip('"\'\n')]
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## benchmark.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from collections import OrderedDict
+from argparse import ArgumentParser, RawTextHelpFormatter
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
+
+###_* --- Define command-line arguments
+
+parser = ArgumentParser(description='''
+============================================================
+Time each program script on synthetic mechanisms of a given number of species,
+sampled (and recombined) from the species in validation/*mech.csv and
+examples/. Each stage is run as a separate process against each pattern file
+in SMARTSpatterns/, and its wall time, species per second and peak resident
+memory are appended (with the date, commit and package versions) to a JSON
+file so that runs can be compared over time. The startup stage times --help of
+each script. Example usage:
+
+$ python benchmark.py -n 1000 10000 -o benchmark.json
+
+''',formatter_class=RawTextHelpFormatter)
+
+###_ . Arguments
+
+parser.add_argument('-n','--species',type=int,nargs='+',default=[1000],
+                    help='numbers of species of synthetic mechanisms')
+parser.add_argument('-s','--stages',type=str,nargs='+',
+                    help='stages to run (default: all of startup, count, matchatoms, simpol, carbontypes, validation)')
+parser.add_argument('-g','--groupfiles',type=str,nargs='+',
+                    help='pattern files in SMARTSpatterns/ (default: all)')
+parser.add_argument('-r','--recombine',type=float,default=0.5,
+                    help='fraction of synthetic species which combine two sampled species')
+parser.add_argument('-o','--outputfile',type=str,default='benchmark.json',
+                    help='JSON file to which results are appended')
+parser.add_argument('-c','--chunksize',type=int,default=10000,
+                    help='chunk size passed to substructure_generate_fulltable.py')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes passed to the search scripts')
+parser.add_argument('-w','--workdir',type=str,
+                    help='directory for synthetic mechanisms and outputs (default: temporary, removed)')
+parser.add_argument('--seed',type=int,default=1,
+                    help='seed for sampling species')
+parser.add_argument('--repeats',type=int,default=5,
+                    help='number of runs of each script in the startup stage (the fastest is reported)')
+
+###_* --- Stages
+
+## each stage is a function of (groupfile, files) returning the command line
+##   of the stage, or None if it does not apply to groupfile; files holds the
+##   names of the synthetic mechanism and outputs of earlier stages
+
+directory = os.path.dirname(os.path.abspath(__file__))
+script = lambda x: [sys.executable, os.path.join(directory, x)]
+
+def count(groupfile, files):
+    files[('count', groupfile)] = os.path.join(files['workdir'], 'count_{}.csv'.format(stem(groupfile)))
+    command = script('substructure_search.py') + [
+        '-d', '-g', groupfile, '-i', files['input'], '-o', files[('count', groupfile)]]
+    if groupfile == 'SIMPOLgroups.csv':
+        command += ['-e', 'SIMPOLexportlist.csv']
+    return command
+
+def matchatoms(groupfile, files):
+    prefix = os.path.join(files['workdir'], 'fulltable_{}'.format(stem(groupfile)))
+    files[('matchatoms', groupfile)] = prefix + '_atomfulltable.csv'
+    return script('substructure_generate_fulltable.py') + [
+        '-d', '-g', groupfile, '-i', files['input'], '-o', prefix, '-c', str(files['chunksize'])]
+
+def simpol(groupfile, files):
+    if groupfile != 'SIMPOLgroups.csv' or ('count', groupfile) not in files:
+        return None
+    return script('simpol.py') + [
+        '-i', files[('count', groupfile)], '-t', '298.15',
+        '-o', os.path.join(files['workdir'], 'simpol.csv')]
+
+def carbontypes(groupfile, files):
+    if ('matchatoms', groupfile) not in files:
+        return None
+    return script('generate_carbontypes.py') + [
+        '-i', files[('matchatoms', groupfile)],
+        '-o', os.path.join(files['workdir'], 'carbontypes_{}'.format(stem(groupfile)))]
+
+def validation(groupfile, files):
+    if ('matchatoms', groupfile) not in files or ('count', 'common_atoms.csv') not in files:
+        return None
+    return script('validation_triple.py') + [
+        '-f', files[('matchatoms', groupfile)], '-a', files[('count', 'common_atoms.csv')],
+        '-o', os.path.join(files['workdir'], 'validation_{}'.format(stem(groupfile)))]
+
+stages = OrderedDict([
+    ('count', count),
+    ('matchatoms', matchatoms),
+    ('simpol', simpol),
+    ('carbontypes', carbontypes),
+    ('validation', validation),
+    ])
+
+## startup: time to print --help, run once for each script (not for each
+##   groupfile and number of species); scripts should reach it without
+##   loading heavy modules (see lazyimport.py)
+
+heavymodules = ['pandas','numpy','scipy','pyarrow','pybel','openbabel','matplotlib']
+startuptarget = 0.1 # seconds
+
+parser.set_defaults(stages=['startup']+list(stages.keys()))
+
+###_* --- Functions
+
+def stem(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+def patternfiles():
+    ## files in SMARTSpatterns/ with columns {substructure, pattern}
+    names = []
+    for filename in sorted(glob.glob(os.path.join(directory, 'SMARTSpatterns', '*.csv'))):
+        columns = pd.read_csv(filename, nrows=0).columns
+        if 'substructure' in columns and 'pattern' in columns:
+            names.append(os.path.basename(filename))
+    return names
+
+def samplespecies():
+    ## SMILES strings of species in validation/*mech.csv and examples/
+    filenames = glob.glob(os.path.join(directory, 'validation', '*mech.csv')) + \
+        glob.glob(os.path.join(directory, 'examples', '*.csv'))
+    smiles = []
+    for filename in sorted(filenames):
+        columns = pd.read_csv(filename, nrows=0).columns
+        if 'SMILES' in columns:
+            smiles.extend(pd.read_csv(filename)['SMILES'].dropna())
+    return np.array(sorted(set(smiles)), dtype=object)
+
+def synthetic(smiles, n, recombine, seed):
+    ## n species sampled with replacement; a fraction (recombine) are
+    ##   disconnected combinations (A.B) of two sampled species, so that the
+    ##   number of distinct SMILES strings grows with n
+    rng = np.random.RandomState(seed)
+    first = smiles[rng.randint(len(smiles), size=n)]
+    second = smiles[rng.randint(len(smiles), size=n)]
+    combined = rng.rand(n) < recombine
+    first[combined] = [a + '.' + b for a, b in zip(first[combined], second[combined])]
+    return pd.DataFrame(OrderedDict([
+        ('compound', ['S{:07d}'.format(i) for i in range(n)]),
+        ('SMILES', first),
+        ]))
+
+def runstage(command, logfile):
+    ## wall time (s), peak resident memory (MB) and exit status of command
+    env = dict(os.environ, MPLBACKEND='Agg')
+    with open(logfile, 'w') as log:
+        start = time.time()
+        proc = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=directory)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.time() - start
+    proc.returncode = status
+    maxrss = usage.ru_maxrss / (1024.**2 if sys.platform == 'darwin' else 1024.)
+    return seconds, maxrss, os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+def lastline(logfile):
+    with open(logfile) as f:
+        lines = [x.strip() for x in f if x.strip()]
+    return lines[-1] if lines else ''
+
+def versions():
+    ## commit and package versions, recorded with each run
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return OrderedDict([
+        ('commit', commit),
+        ('python', sys.version.split()[0]),
+        ('numpy', np.__version__),
+        ('pandas', pd.__version__),
+        ])
+
+def previousresults(runs):
+    ## most recent result for each (stage, groupfile or script, species)
+    previous = {}
+    for run in runs:
+        for x in run['results']:
+            if x['status'] == 'ok':
+                previous[(x['stage'], x.get('groupfile', x.get('script')), x.get('species'))] = x
+    return previous
+
+def scripts():
+    ## scripts with command-line arguments
+    names = []
+    for filename in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        with open(filename) as f:
+            if 'parse_args()' in f.read():
+                names.append(os.path.basename(filename))
+    return names
+
+def startup(name, repeats):
+    ## fastest wall time (s) of name --help over repeats, heavy modules
+    ##   loaded (from -X importtime), and exit status
+    command = script(name) + ['--help']
+    env = dict(os.environ, MPLBACKEND='Agg')
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeats):
+            start = time.time()
+            status = subprocess.call(command, stdout=devnull, stderr=devnull, env=env, cwd=directory)
+            times.append(time.time() - start)
+    proc = subprocess.Popen(command[:1] + ['-X', 'importtime'] + command[1:], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, env=env, cwd=directory)
+    _, stderr = proc.communicate()
+    imported = set(x.split('|')[-1].strip() for x in stderr.decode().splitlines() if x.startswith('import time:'))
+    loaded = [x for x in heavymodules if any(y == x or y.startswith(x + '.') for y in imported)]
+    return min(times), loaded, status == 0
+
+if __name__=='__main__':
+
+###_* --- Parse arguments
+
+    args = parser.parse_args()
+    groupfiles = args.groupfiles or patternfiles()
+    for x in args.stages:
+        if x not in stages and x != 'startup':
+            sys.exit('USER ERROR: unknown stage "{}"'.format(x))
+
+    ## count stage with common_atoms.csv is needed for validation
+    needed = set(groupfiles)
+    if 'validation' in args.stages:
+        needed.add('common_atoms.csv')
+    if 'simpol' in args.stages:
+        needed.add('SIMPOLgroups.csv')
+
+    if os.path.exists(args.outputfile):
+        with open(args.outputfile) as f:
+            runs = json.load(f)
+    else:
+        runs = []
+    previous = previousresults(runs)
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='benchmark'))
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+
+###_* --- Run stages
+
+    run = OrderedDict([
+        ('date', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('versions', versions()),
+        ('cpus', os.cpu_count()),
+        ('jobs', args.jobs),
+        ('recombine', args.recombine),
+        ('seed', args.seed),
+        ('results', []),
+        ])
+
+    try:
+        if 'startup' in args.stages:
+            print('{:<40s} {:>8s} {:>8s}  {}'.format('script', 'ms', 'change', 'modules loaded by --help'))
+            for name in scripts():
+                seconds, loaded, ok = startup(name, args.repeats)
+                result = OrderedDict([
+                    ('stage', 'startup'),
+                    ('script', name),
+                    ('seconds', round(seconds, 4)),
+                    ('modules', loaded),
+                    ('status', 'ok' if ok else 'error'),
+                    ])
+                run['results'].append(result)
+                before = previous.get(('startup', name, None))
+                change = '{:+.0%}'.format(seconds / before['seconds'] - 1) if before and ok else ''
+                print('{:<40s} {:>8.1f} {:>8s}  {}{}'.format(
+                    name, 1e3 * seconds, change, ', '.join(loaded),
+                    '' if seconds < startuptarget else '  (target: {:.0f} ms)'.format(1e3 * startuptarget)))
+            print('')
+
+        names = [x for x in args.stages if x != 'startup']
+        if names:
+            smiles = samplespecies()
+            print('{:<12s} {:<20s} {:>8s} {:>10s} {:>12s} {:>10s} {:>8s}'.format(
+                'stage', 'groupfile', 'species', 'seconds', 'species/s', 'RSS (MB)', 'change'))
+        for n in args.species if names else []:
+            files = {'workdir': workdir, 'chunksize': args.chunksize,
+                     'input': os.path.join(workdir, 'synthetic_{:d}.csv'.format(n))}
+            synthetic(smiles, n, args.recombine, args.seed).to_csv(files['input'], index=False)
+            for name in names:
+                for groupfile in sorted(needed if name == 'count' else groupfiles):
+                    command = stages[name](groupfile, files)
+                    if command is None:
+                        continue
+                    if args.jobs != 1 and name in ['count', 'matchatoms']:
+                        command += ['-j', str(args.jobs)]
+                    logfile = os.path.join(workdir, '{}_{}_{:d}.log'.format(name, stem(groupfile), n))
+                    seconds, maxrss, ok = runstage(command, logfile)
+                    result = OrderedDict([
+                        ('stage', name),
+                        ('groupfile', groupfile),
+                        ('species', n),
+                        ('seconds', round(seconds, 3)),
+                        ('species_per_second', round(n / seconds, 1)),
+                        ('peak_rss_mb', round(maxrss, 1)),
+                        ('status', 'ok' if ok else 'error'),
+                        ])
+                    if not ok:
+                        result['error'] = lastline(logfile)
+                        ## later stages do not use outputs of a failed stage
+                        files.pop((name, groupfile), None)
+                    run['results'].append(result)
+                    before = previous.get((name, groupfile, n))
+                    change = '{:+.0%}'.format(result['species_per_second'] / before['species_per_second'] - 1) \
+                        if before and ok else ''
+                    print('{:<12s} {:<20s} {:>8d} {:>10.2f} {:>12.1f} {:>10.1f} {:>8s}{}'.format(
+                        name, stem(groupfile), n, seconds, n / seconds, maxrss, change,
+                        '' if ok else '  ERROR: ' + result['error']))
+    finally:
+        runs.append(run)
+        with open(args.outputfile, 'w') as f:
+            json.dump(runs, f, indent=1)
+        if not args.workdir:
+            shutil.rmtree(workdir)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## cache.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Persistent (SQLite) store of searchgroups results so that species shared
+##   among mechanisms are only matched once. Entries are keyed by a digest of
+##   the patterns, export list, method, Open Babel version, source of the
+##   matching code (searchgroups, patternset, groupexpr, prefilter.py) and
+##   userdef.py source, and by canonical SMILES. For matchatoms, atom indices follow the order of atoms in the
+##   input SMILES string so the input string is also part of the key.
+
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import inspect
+from collections import OrderedDict
+import util
+import prefilter
+from util import searchgroups, mapsearch
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+pd = lazyimport('pandas')
+
+## code which determines which patterns are tried and the form of results
+matchingcode = [searchgroups, util.patternset, util.groupexpr, util.vectorize, util._vectorize, prefilter]
+
+def obversion():
+    ## aromaticity and SMARTS perception (and so counts and atom types)
+    ##   differ between releases of Open Babel
+    version = getattr(pybel.ob,'OBReleaseVersion','')
+    return version() if callable(version) else str(version)
+
+def canonical(smilesstr):
+    return pybel.readstring('smi',smilesstr).write('can').split()[0]
+
+def patterndigest(search,method):
+    ## digest of everything that determines the result of search.<method>
+    h = hashlib.sha1()
+    h.update(method.encode('utf-8'))
+    h.update(pd.__version__.encode('utf-8')) # pickled values
+    h.update(search.groups.to_csv().encode('utf-8'))
+    if search.include is not None:
+        h.update(pd.Series(search.include).to_csv().encode('utf-8'))
+    h.update(obversion().encode('utf-8'))
+    for code in matchingcode:
+        h.update(inspect.getsource(code).encode('utf-8'))
+    if 'userdef' in sys.modules:
+        try:
+            h.update(inspect.getsource(sys.modules['userdef']).encode('utf-8'))
+        except (IOError,TypeError):
+            pass
+    return h.hexdigest()
+
+class resultcache:
+
+    batchsize = 500 # number of keys per SELECT statement
+
+    def __init__(self,filename,maxsize=None):
+        ## maxsize is the maximum number of entries retained in the file;
+        ##   least recently used entries are evicted beyond this number
+        self.filename = filename
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.digests = {}
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results ('
+                        'digest TEXT, smiles TEXT, value BLOB, used REAL, '
+                        'PRIMARY KEY (digest, smiles))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def digest(self,search,method):
+        key = (id(search),method)
+        if key not in self.digests:
+            self.digests[key] = patterndigest(search,method)
+        return self.digests[key]
+
+    def get(self,digest,keys):
+        found = {}
+        keys = list(set(keys))
+        for i in range(0,len(keys),self.batchsize):
+            batch = keys[i:i+self.batchsize]
+            rows = self.db.execute(
+                'SELECT smiles, value FROM results WHERE digest=? AND smiles IN ({})'
+                .format(','.join('?'*len(batch))),[digest]+batch)
+            for smiles, value in rows:
+                found[smiles] = pickle.loads(bytes(value))
+        if found:
+            self.db.executemany('UPDATE results SET used=? WHERE digest=? AND smiles=?',
+                                [(time.time(),digest,k) for k in found])
+        return found
+
+    def put(self,digest,items):
+        self.db.executemany('INSERT OR REPLACE INTO results VALUES (?,?,?,?)',
+                            [(digest,k,sqlite3.Binary(pickle.dumps(v,2)),time.time())
+                             for k, v in items])
+        self.db.commit()
+
+    def evict(self):
+        if not self.maxsize:
+            return 0
+        n = self.size()-self.maxsize
+        if n > 0:
+            self.db.execute('DELETE FROM results WHERE rowid IN '
+                            '(SELECT rowid FROM results ORDER BY used LIMIT ?)',(n,))
+            self.db.commit()
+        return max(n,0)
+
+    def size(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def stats(self):
+        total = self.hits+self.misses
+        return ('cache {}: {:d} hits, {:d} misses ({:.1f}% hit rate), {:d} entries'
+                .format(self.filename,self.hits,self.misses,
+                        100.*self.hits/total if total else 0.,self.size()))
+
+    def close(self):
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+    def mapsearch(self,search,method,smiles,jobs=1,pool=None):
+        ## as util.mapsearch, but only SMILES strings not found in the cache
+        ##   are matched; their results are added to the cache
+        smiles = list(smiles)
+        digest = self.digest(search,method)
+        if method=='matchatoms':
+            keys = ['{}\t{}'.format(canonical(x),x) for x in smiles]
+        else:
+            keys = [canonical(x) for x in smiles]
+        found = self.get(digest,keys)
+        missing = OrderedDict((k,x) for k, x in zip(keys,smiles) if k not in found)
+        computed = mapsearch(search,method,missing.values(),jobs,pool=pool)
+        self.put(digest,zip(missing.keys(),computed))
+        found.update(zip(missing.keys(),computed))
+        self.hits += len(keys)-len(missing)
+        self.misses += len(missing)
+        return [found[k] for k in keys]
@@ -27,8 +27,13 @@
 
 import os
 import re
-import pandas as pd
 from argparse import ArgumentParser, RawTextHelpFormatter
+from tableio import formats, extensions, writetable, layouts, countmatrix, writematrix
+from atomindex import readatomtable, readcompounds
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 ## -----------------------------------------------------------------------------
 
@@ -45,9 +50,99 @@ $ python generate_carbontypes.py -i apinene_MCMgroups_atomfulltable.csv -o apine
 ## Arguments
 
 parser.add_argument('-i','--inputfile',type=str,
-                    help='file generated by substructure_generate_fulltable.py; csv format')
+                    help='file generated by substructure_generate_fulltable.py; csv, parquet, feather or atom index (.bin) format')
 parser.add_argument('-o','--outputprefix',type=str,default='output',
                     help='output prefix')
+parser.add_argument('-f','--format',type=str,choices=formats,default='csv',
+                    help='format of output files')
+parser.add_argument('-s','--sparse',type=str,choices=layouts,
+                    help='write X, Y and Theta as sparse matrices (.npz) in this layout')
+parser.add_argument('-c','--compounds',type=str,
+                    help='text file with list of compounds to include in a single column (default: all)')
+
+## -----------------------------------------------------------------------------
+
+def distinctrows(values):
+    ## for an integer array, returns the first row of each distinct row (in
+    ##   order of appearance) and the number of the distinct row of each row.
+    ##   Each row is packed into a single 64-bit key (mixed radix over the
+    ##   range of each column); keys are renumbered when the next column
+    ##   would overflow them
+    keys = np.zeros(len(values), dtype=np.int64)
+    nkeys = 1
+    for column in values.T:
+        if not len(column):
+            break
+        column = column - column.min()
+        base = int(column.max()) + 1
+        if nkeys * base >= 2**62:
+            _, keys = np.unique(keys, return_inverse=True)
+            nkeys = int(keys.max()) + 1
+        keys = keys * base + column
+        nkeys *= base
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    return first[order], np.argsort(order)[inverse.ravel()]
+
+def carbonmask(fulltable):
+    ## rows of carbon atoms (atom types matched once for each type)
+    types = fulltable['type'].dropna().unique()
+    return fulltable['type'].isin([x for x in types if re.search('^C|c', x)])
+
+def label_ctype(x):
+    ## x is an array of group counts
+    return '({})'.format(', '.join(x.astype(str)))
+
+def carbonatoms(fulltable):
+    ## group counts of each carbon atom, to be used for creation of Y and
+    ##   Theta matrix (groups of categorical columns read from parquet or
+    ##   feather files are in order of appearance, so tables are sorted as for
+    ##   csv files)
+    return (
+        fulltable
+        .loc[carbonmask(fulltable)]
+        .groupby(['compound','atom','type','group'],observed=True)['match'].count()
+        .unstack(level='group', fill_value=0)
+        .sort_index().sort_index(axis=1)
+        )
+
+def carbontypes(wf):
+    ## carbon types are the distinct rows of group counts; labels are
+    ##   formatted once for each type. Returns the label of each atom and
+    ##   Theta (types in order of first appearance x groups)
+    first, inverse = distinctrows(wf.values)
+    ctypes = wf.values[first]
+    ctype_labels = np.array([label_ctype(x) for x in ctypes], dtype=object)
+    theta = pd.DataFrame(ctypes, index=pd.Index(ctype_labels, name='ctype'), columns=wf.columns)
+    return ctype_labels[inverse], theta
+
+def xmatrix(fulltable):
+    return (
+        fulltable[['compound', 'match', 'group']].drop_duplicates()
+        .groupby(['compound', 'group'],observed=True)['match'].count()
+        .unstack(level='group', fill_value=0)
+        .sort_index().sort_index(axis=1)
+        )
+
+def ymatrix(wf):
+    return (
+        wf.reset_index()[['compound', 'atom', 'ctype']]
+        .groupby(['compound', 'ctype'],observed=True)['atom'].count()
+        .unstack(level='ctype', fill_value=0)
+        .sort_index().sort_index(axis=1)
+        )
+
+def gammatable(fulltable, xcols):
+    gamma = (
+        fulltable.loc[carbonmask(fulltable)]
+        .groupby(['compound', 'match', 'group'],observed=True)['atom'].count()
+        .reset_index('group').reset_index(drop=True).drop_duplicates()
+        .rename(columns={"atom": "count"})
+        .set_index('group').loc[xcols]
+    )
+    gamma['gamma'] = 1/gamma['count']
+    del gamma['count']
+    return gamma
 
 ## -----------------------------------------------------------------------------
 
@@ -63,63 +158,54 @@ if __name__=='__main__':
 
     ## read file
 
-    fulltable = pd.read_csv(filename)
+    compounds = readcompounds(args.compounds) if args.compounds else None
+    fulltable = readatomtable(filename, compounds)
 
     ## -------------------------------------------------------------------------
 
-    ## x is a pandas Series
-
-    label_ctype = lambda x: '({})'.format(', '.join(x.astype(str)))
+    wf = carbonatoms(fulltable)
+    wf['ctype'], theta = carbontypes(wf)
 
     ## -------------------------------------------------------------------------
 
-    ## to be used for creation of Y and Theta matrix
+    if args.sparse:
 
-    wf = (
-        fulltable
-        .loc[~fulltable['type'].isnull() & fulltable['type'].str.contains('^C|c')]
-        .groupby(['compound','atom','type','group'])['match'].count()
-        .unstack(level='group', fill_value=0)
-        )
+        ## counts are summed from (compound, group) and (compound, ctype)
+        ##   records; the dense X and Y matrices are not formed
 
-    fgvars = wf.columns
-    wf['ctype'] = wf.apply(label_ctype, axis=1)
+        labels = lambda x, name: pd.Index(sorted(x.unique()), name=name)
 
-    ## -------------------------------------------------------------------------
+        records = fulltable.loc[fulltable['match'].notnull(), ['compound', 'match', 'group']].drop_duplicates()
+        xrows, xcols = labels(records['compound'], 'compound'), labels(records['group'], 'group')
+        xmat = countmatrix(records['compound'], records['group'], xrows, xcols)
 
-    xmat = (
-        fulltable[['compound', 'match', 'group']].drop_duplicates()
-        .groupby(['compound', 'group'])['match'].count()
-        .unstack(level='group', fill_value=0)
-        )
+        records = wf.reset_index()[['compound', 'ctype']]
+        yrows, ycols = labels(records['compound'], 'compound'), labels(records['ctype'], 'ctype')
+        ymat = countmatrix(records['compound'], records['ctype'], yrows, ycols)
 
-    ymat = (
-        wf.reset_index()[['compound', 'atom', 'ctype']]
-        .groupby(['compound', 'ctype'])['atom'].count()
-        .unstack(level='ctype', fill_value=0)
-        )
+    else:
 
-    theta = wf[fgvars].drop_duplicates()
-    theta.index = theta.apply(label_ctype, axis=1)
-    theta.index.name = 'ctype'
+        xmat = xmatrix(fulltable)
+        xcols = xmat.columns
+        ymat = ymatrix(wf)
 
     ## -----------------------------------------------------------------------------
 
-    gamma = (
-        fulltable.loc[fulltable['type'].str.contains('^C|c')]
-        .groupby(['compound', 'match', 'group'])['atom'].count()
-        .reset_index('group').reset_index(drop=True).drop_duplicates()
-        .rename(columns={"atom": "count"})
-        .set_index('group').loc[xmat.columns]
-    )
-    gamma['gamma'] = 1/gamma['count']
-    del gamma['count']
+    gamma = gammatable(fulltable, xcols)
     
     ## -------------------------------------------------------------------------
 
     ## export
 
-    xmat.to_csv('{}_carbontypes_X.csv'.format(prefix))
-    ymat.to_csv('{}_carbontypes_Y.csv'.format(prefix))
-    theta.to_csv('{}_carbontypes_Theta.csv'.format(prefix))
-    gamma.to_csv('{}_carbontypes_gamma.csv'.format(prefix))
+    outputfile = '{}_carbontypes_{}'+extensions[args.format]
+    if args.sparse:
+        from scipy.sparse import csr_matrix
+        writematrix(xmat,xrows,xcols,outputfile.format(prefix,'X'),args.sparse)
+        writematrix(ymat,yrows,ycols,outputfile.format(prefix,'Y'),args.sparse)
+        writematrix(csr_matrix(theta.values),theta.index,theta.columns,
+                    outputfile.format(prefix,'Theta'),args.sparse)
+    else:
+        writetable(xmat,outputfile.format(prefix,'X'),args.format,xmat.index.name)
+        writetable(ymat,outputfile.format(prefix,'Y'),args.format,ymat.index.name)
+        writetable(theta,outputfile.format(prefix,'Theta'),args.format,theta.index.name)
+    writetable(gamma,outputfile.format(prefix,'gamma'),args.format,gamma.index.name)
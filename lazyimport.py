@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## lazyimport.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Modules loaded on first access of an attribute, so that scripts parse
+##   their arguments (and print --help) without loading pandas, numpy or
+##   Open Babel. Used in place of module-level imports of these packages:
+##
+##     pd = lazyimport('pandas')
+##
+##   The module is registered in sys.modules, so that later imports of the
+##   same name (by any module) return it. A module which is not installed
+##   raises ImportError immediately, as with import. Names of submodules
+##   (e.g., matplotlib.pyplot) load their parent packages, and modules which
+##   replace themselves in sys.modules (openbabel 3) cannot be loaded this
+##   way; these are imported where they are used instead (Open Babel is used
+##   through pybel.ob). Without importlib.util.LazyLoader (python 2), modules
+##   are imported immediately.
+
+import sys
+import importlib
+
+try:
+    from importlib.util import find_spec, module_from_spec, LazyLoader
+except ImportError:
+    LazyLoader = None
+
+def lazyimport(name):
+    ## modules in sys.modules are returned as they are; importing them again
+    ##   would load modules not yet loaded
+    if name in sys.modules:
+        return sys.modules[name]
+    if LazyLoader is None or '.' in name:
+        return importlib.import_module(name)
+    spec = find_spec(name)
+    if spec is None:
+        raise ImportError('No module named {}'.format(name))
+    spec.loader = LazyLoader(spec.loader)
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
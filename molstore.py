@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## molstore.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Parsed pybel Molecules by SMILES string, so that tools applied to the same
+##   species in one process (searchgroups.count and matchatoms, molecular
+##   attributes, adjacent atoms) parse and add hydrogens only once.
+##
+## Molecules are kept in memory only: atom indices and the order of matches
+##   depend on the order in which Open Babel's SMILES parser creates atoms
+##   and bonds, which is not reproduced by reading back any of its file
+##   formats. Molecules returned by the store are shared and should not be
+##   modified (other than to attach derived data, e.g., userdef.ring_index).
+
+from collections import OrderedDict
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+
+class moleculestore:
+
+    def __init__(self,maxsize=5000):
+        ## maxsize is the number of molecules retained; least recently used
+        ##   molecules are evicted beyond this number
+        self.maxsize = maxsize
+        self.molecules = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,smilesstr,addh=True):
+        key = (smilesstr,addh)
+        mol = self.molecules.pop(key,None)
+        if mol is None:
+            self.misses += 1
+            mol = pybel.readstring('smi',smilesstr)
+            if addh:
+                mol.addh()
+        else:
+            self.hits += 1
+        self.molecules[key] = mol # most recently used is last
+        while len(self.molecules) > self.maxsize:
+            self.molecules.popitem(last=False)
+        return mol
+
+    def clear(self):
+        self.molecules.clear()
+
+## store shared by all tools in the process
+default = moleculestore()
+
+def readmolecule(smilesstr,addh=True):
+    return default.get(smilesstr,addh)
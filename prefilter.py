@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## prefilter.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Necessary conditions for SMARTS patterns to match a molecule, so that
+##   patterns which cannot match are given zero matches without calling
+##   Open Babel.
+##
+## Atoms of a molecule are classified by kind (atomic number, aromatic). For
+##   each atom of a pattern, the kinds of atoms it may match are determined
+##   from the element, atomic number (#n), aromaticity (A, a, lowercase
+##   symbols) and recursive ($()) primitives of its expression; all other
+##   primitives (H, D, X, R, charge, ...) are assumed to be satisfiable, so
+##   the conditions are necessary but not sufficient. A pattern cannot match
+##   if one of its atoms matches no atom of the molecule, or if more of its
+##   atoms are restricted to a set of kinds than the molecule has atoms of
+##   these kinds (atoms of a match are distinct). Patterns which are not
+##   parsed (e.g., unrecognized element symbols) are always searched.
+
+import re
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+
+## element symbols in order of atomic number
+_symbols = '''H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn
+Fe Co Ni Cu Zn Ga Ge As Se Br Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb
+Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb Lu Hf Ta W Re Os Ir Pt
+Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am Cm Bk Cf Es Fm Md No Lr Rf
+Db Sg Bh Hs Mt Ds Rg Cn Nh Fl Mc Lv Ts Og'''.split()
+elements = dict(zip(_symbols,range(1,len(_symbols)+1)))
+
+_organic = ['Cl','Br','B','C','N','O','P','S','F','I']   # outside brackets
+_aromatic = {'se':34,'as':33,'b':5,'c':6,'n':7,'o':8,'p':15,'s':16}
+
+_ANY, _UNKNOWN = ('any',), ('unknown',)
+
+class unparsed(Exception):
+    pass
+
+###_* --- Parsing
+
+def _close(s,i):
+    ## position of the bracket or parenthesis closing s[i]
+    depth = 0
+    for j in range(i,len(s)):
+        if s[j] in '[(':
+            depth += 1
+        elif s[j] in '])':
+            depth -= 1
+            if depth == 0:
+                return j
+    raise unparsed(s)
+
+def _digits(s,i):
+    j = i
+    while j < len(s) and s[j].isdigit():
+        j += 1
+    return j
+
+class _expression:
+
+    ## atom expression (contents of brackets) as a tree of tuples: ('and',
+    ##   [...]), ('or', [...]), ('not', x), ('elem', Z, aromatic or None),
+    ##   ('arom', aromatic), ('rec', signature), any and unknown. Operators in
+    ##   order of increasing precedence: ';', ',', '&' (or implicit), '!'
+
+    def __init__(self,s):
+        self.s, self.i = s, 0
+
+    def parse(self):
+        node = self.operator(';',self.disjunction,'and')
+        if self.i != len(self.s):
+            raise unparsed(self.s)
+        return node
+
+    def peek(self):
+        return self.s[self.i] if self.i < len(self.s) else ''
+
+    def operator(self,symbol,operand,name):
+        nodes = [operand()]
+        while self.peek() == symbol:
+            self.i += 1
+            nodes.append(operand())
+        return (name,nodes) if len(nodes) > 1 else nodes[0]
+
+    def disjunction(self):
+        return self.operator(',',self.conjunction,'or')
+
+    def conjunction(self):
+        nodes = [self.unary()]
+        while self.peek() not in ['',';',',']:
+            if self.peek() == '&':
+                self.i += 1
+            nodes.append(self.unary())
+        return ('and',nodes) if len(nodes) > 1 else nodes[0]
+
+    def unary(self):
+        if self.peek() == '!':
+            self.i += 1
+            return ('not',self.unary())
+        return self.primitive()
+
+    def primitive(self):
+        s, i = self.s, self.i
+        c = self.peek()
+        two = s[i:i+2]
+        if two == '$(':
+            j = _close(s,i+1)
+            self.i = j+1
+            return ('rec',signature(s[i+2:j]))
+        if c == '#':
+            self.i = _digits(s,i+1)
+            if self.i == i+1:
+                raise unparsed(s)
+            return ('elem',int(s[i+1:self.i]),None)
+        if c == '*':
+            self.i += 1
+            return _ANY
+        if c.isdigit():                     # isotope
+            self.i = _digits(s,i)
+            return _UNKNOWN
+        if c in '+-':                       # charge
+            while self.peek() == c:
+                self.i += 1
+            self.i = _digits(s,self.i)
+            return _UNKNOWN
+        if c in '@:':                       # chirality, atom class
+            while self.peek() in ['@','?']:
+                self.i += 1
+            self.i = _digits(s,self.i+(c == ':'))
+            return _UNKNOWN
+        if c.isupper():
+            ## two-letter symbols take precedence (as in Open Babel)
+            if len(two) == 2 and two[1].islower() and two in elements:
+                self.i += 2
+                return ('elem',elements[two],False)
+            if c in 'HDXR':                 # hydrogen count, degree, connectivity, ring
+                self.i = _digits(s,i+1)
+                return _UNKNOWN
+            if c == 'A':
+                self.i += 1
+                return ('arom',False)
+            if c in elements:
+                self.i += 1
+                return ('elem',elements[c],False)
+        if c.islower():
+            for symbol in _aromatic:
+                if s.startswith(symbol,i):
+                    self.i += len(symbol)
+                    return ('elem',_aromatic[symbol],True)
+            if c == 'a':
+                self.i += 1
+                return ('arom',True)
+            if c in 'rvxh':                 # ring size, valence, ring connectivity, implicit H
+                self.i = _digits(s,i+1)
+                return _UNKNOWN
+        raise unparsed(s)
+
+def _atoms(s):
+    ## atom expressions of a SMARTS pattern (bonds, branches and ring
+    ##   closures are skipped)
+    atoms = []
+    i = 0
+    while i < len(s):
+        c = s[i]
+        if c == '[':
+            j = _close(s,i)
+            atoms.append(_expression(s[i+1:j]).parse())
+            i = j+1
+            continue
+        symbol = next((x for x in _organic if s.startswith(x,i)),None)
+        if symbol:
+            atoms.append(('elem',elements[symbol],False))
+            i += len(symbol)
+        elif c in 'bcnops':
+            atoms.append(('elem',_aromatic[c],True))
+            i += 1
+        elif c in '*Aa':
+            atoms.append({'*':_ANY,'A':('arom',False),'a':('arom',True)}[c])
+            i += 1
+        elif c in '-=#:~@/\\!&;,.()%0123456789':
+            i += 1
+        else:
+            raise unparsed(s)
+    if not atoms:
+        raise unparsed(s)
+    return atoms
+
+###_* --- Conditions
+
+def _maybe(node,kind,present):
+    ## whether an atom of kind may satisfy node in a molecule with atoms of
+    ##   the kinds in present
+    op = node[0]
+    if op == 'elem':
+        return node[1] == kind[0] and node[2] in (None,kind[1])
+    if op == 'arom':
+        return node[1] == kind[1]
+    if op == 'and':
+        return all(_maybe(x,kind,present) for x in node[1])
+    if op == 'or':
+        return any(_maybe(x,kind,present) for x in node[1])
+    if op == 'not':
+        return not _surely(node[1],kind,present)
+    if op == 'rec':
+        return _maybe(node[1].atoms[0],kind,present) and node[1].possible(present)
+    return True # any, unknown
+
+def _surely(node,kind,present):
+    ## whether an atom of kind satisfies node
+    op = node[0]
+    if op in ('elem','arom'):
+        return _maybe(node,kind,present)
+    if op == 'and':
+        return all(_surely(x,kind,present) for x in node[1])
+    if op == 'or':
+        return any(_surely(x,kind,present) for x in node[1])
+    if op == 'not':
+        return not _maybe(node[1],kind,present)
+    return op == 'any'
+
+class signature:
+
+    def __init__(self,pattern):
+        self.atoms = _atoms(pattern)
+        self.memo = {}
+
+    def candidates(self,present):
+        ## kinds of atoms in present which each atom of the pattern may match
+        return [frozenset(k for k in present if _maybe(a,k,present)) for a in self.atoms]
+
+    def possible(self,present):
+        if present not in self.memo:
+            self.memo[present] = all(self.candidates(present))
+        return self.memo[present]
+
+    def constraints(self,present):
+        ## (kinds, number of atoms) required of a molecule whose atoms are of
+        ##   the kinds in present; None if the pattern cannot match
+        candidates = self.candidates(present)
+        if not all(candidates):
+            return None
+        required = []
+        for kinds in set(candidates):
+            n = sum(1 for x in candidates if x <= kinds)
+            if n > 1:
+                required.append((tuple(kinds),n))
+        return required
+
+def smartssignature(pattern):
+    ## signature of a SMARTS pattern, or None if it is not parsed
+    try:
+        return signature(pattern)
+    except (unparsed, ValueError, KeyError, IndexError):
+        return None
+
+###_* --- Molecules
+
+_formula = re.compile('([A-Z][a-z]?)([0-9]*)')
+_smarts = {} # compiled on first use
+
+def _compiled(pattern):
+    if pattern not in _smarts:
+        _smarts[pattern] = pybel.Smarts(pattern)
+    return _smarts[pattern]
+
+def atomkinds(mol):
+    ## number of atoms of each kind (atomic number, aromatic), from the
+    ##   formula and aromatic atoms; None if an element is not recognized.
+    ##   Stored with the molecule.
+    kinds = getattr(mol,'_atomkinds',False)
+    if kinds is not False:
+        return kinds
+    kinds = {}
+    for symbol, n in _formula.findall(mol.OBMol.GetFormula()):
+        if symbol not in elements:
+            kinds = None
+            break
+        kinds[(elements[symbol],False)] = kinds.get((elements[symbol],False),0) + int(n or 1)
+    if kinds is not None:
+        for (idx,) in _compiled('a').findall(mol):
+            z = mol.OBMol.GetAtom(idx).GetAtomicNum()
+            kinds[(z,False)] -= 1
+            kinds[(z,True)] = kinds.get((z,True),0) + 1
+        kinds = {k:v for k, v in kinds.items() if v > 0}
+    mol._atomkinds = kinds
+    return kinds
+
+class patternfilter:
+
+    ## keys of SMARTS patterns which cannot match a molecule. Conditions are
+    ##   derived once for each set of kinds of atoms present in molecules
+
+    def __init__(self,patterns):
+        ## patterns is a mapping of keys to SMARTS strings
+        self.signatures = [(key,smartssignature(pattern)) for key, pattern in patterns.items()]
+        self.signatures = [(key,sig) for key, sig in self.signatures if sig is not None]
+        self.conditions = {}
+
+    def __condition(self,present):
+        absent, required = set(), []
+        for key, sig in self.signatures:
+            constraints = sig.constraints(present)
+            if constraints is None:
+                absent.add(key)
+            elif constraints:
+                required.append((key,constraints))
+        return absent, required
+
+    def impossible(self,mol):
+        if not self.signatures:
+            return set()
+        kinds = atomkinds(mol)
+        if kinds is None:
+            return set()
+        present = frozenset(kinds)
+        if present not in self.conditions:
+            self.conditions[present] = self.__condition(present)
+        absent, required = self.conditions[present]
+        if not required:
+            return absent
+        absent = set(absent)
+        for key, constraints in required:
+            for k, n in constraints:
+                if sum(kinds[x] for x in k) < n:
+                    absent.add(key)
+                    break
+        return absent
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## profiling.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Cumulative wall time, number of calls and number of matches of each
+##   SMARTS pattern, expression and userdef function evaluated by
+##   searchgroups (opt-in: searchgroups(..., profile=searchprofile())).
+##
+## The compiled patterns of a profiled searchgroups object are replaced by
+##   timed wrappers, so that the search itself is unchanged. Calls are counted
+##   per molecule: expressions evaluated for the columns of counts of many
+##   molecules at once are counted once for each molecule they are evaluated
+##   for. Matches are the numbers of matches of SMARTS patterns, and the
+##   values (counts) or sizes (sets of matched atoms) of expressions. Time of
+##   an expression includes that of userdef functions it calls.
+
+import copy
+import time
+from collections import OrderedDict
+from lazyimport import lazyimport
+
+np = lazyimport('numpy')
+pd = lazyimport('pandas')
+
+timer = getattr(time,'perf_counter',time.time)
+
+def nmatches(value):
+    ## number of matches represented by a value returned by a pattern
+    if hasattr(value,'__len__'):
+        return len(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+class searchprofile:
+
+    columns = ['kind','name','seconds','calls','matches']
+
+    def __init__(self):
+        self.records = OrderedDict() # (kind, name) -> [seconds, calls, matches]
+
+    def add(self,kind,name,seconds,calls,matches):
+        record = self.records.get((kind,name))
+        if record is None:
+            self.records[(kind,name)] = [seconds,calls,matches]
+        else:
+            record[0] += seconds
+            record[1] += calls
+            record[2] += matches
+
+    def call(self,kind,name,fn,*args):
+        ## value of fn(*args), timed
+        start = timer()
+        value = fn(*args)
+        self.add(kind,name,timer()-start,1,nmatches(value))
+        return value
+
+    def merge(self,records):
+        ## records of another profile (e.g., of a worker process)
+        for (kind,name), values in records.items():
+            self.add(kind,name,*values)
+
+    def pop(self):
+        records = self.records
+        self.records = OrderedDict()
+        return records
+
+    def wrap(self,patterns,store):
+        ## copies of a patternset and molecule store whose SMARTS patterns,
+        ##   expressions and parsing are timed
+        patterns = copy.copy(patterns)
+        patterns.smarts = OrderedDict(
+            (key, timedsmarts(self,key,smarts)) for key, smarts in patterns.smarts.items())
+        for attr, kind in [('evalexpr','eval'),('quotedexpr','quoted'),('bracketexpr','expression')]:
+            setattr(patterns,attr,OrderedDict(
+                (key, timedexpr(self,kind,key,expr)) for key, expr in getattr(patterns,attr).items()))
+        return patterns, timedstore(self,store)
+
+    def table(self):
+        ## records sorted by decreasing time
+        table = pd.DataFrame([list(k)+list(v) for k, v in self.records.items()],
+                             columns=self.columns)
+        table['ms per call'] = 1e3*table['seconds']/table['calls'].where(table['calls']>0)
+        table['fraction'] = table['seconds']/table.loc[table['kind']!='userdef','seconds'].sum()
+        return table.sort_values('seconds',ascending=False,kind='mergesort').reset_index(drop=True)
+
+    def report(self,n=None):
+        table = self.table()
+        if n is not None:
+            table = table.head(n)
+        return table.to_string(index=False,float_format=lambda x: '{:.4g}'.format(x))
+
+    def write(self,filename,fmt=None):
+        from tableio import writetable
+        writetable(self.table(),filename,fmt)
+
+class timedsmarts:
+
+    def __init__(self,profile,key,smarts):
+        self.profile, self.key, self.smarts = profile, key, smarts
+
+    def findall(self,mol):
+        return self.profile.call('SMARTS',self.key,self.smarts.findall,mol)
+
+class timedexpr:
+
+    ## groupexpr whose evaluation is timed; userdef functions called by the
+    ##   expression are timed separately
+
+    def __init__(self,profile,kind,key,expr):
+        self.profile, self.kind, self.key, self.expr = profile, kind, key, expr
+        self.names = expr.names
+        self.usesmolecule = expr.usesmolecule
+        self.namespace = None
+
+    def evaluate(self,values,mol=None):
+        if self.namespace is None:
+            self.namespace = timednamespace(self.profile)
+        return self.profile.call(self.kind,self.key,self.expr.evaluate,values,mol,self.namespace)
+
+    def evaluatecolumns(self,columns,nrows):
+        ## rows left to evaluate() (NaN) are counted there
+        start = timer()
+        values = self.expr.evaluatecolumns(columns,nrows)
+        valid = ~np.isnan(values)
+        self.profile.add(self.kind,self.key,timer()-start,int(valid.sum()),float(values[valid].sum()))
+        return values
+
+class timedstore:
+
+    def __init__(self,profile,store):
+        self.profile, self.store = profile, store
+
+    def get(self,smilesstr,addh=True):
+        return self.profile.call('parse','SMILES',self.store.get,smilesstr,addh)
+
+class timedmodule:
+
+    ## module whose functions are timed (by 'module.function')
+
+    def __init__(self,profile,module):
+        self.profile, self.module = profile, module
+        self.functions = {}
+
+    def __getattr__(self,name):
+        fn = getattr(self.module,name)
+        if not callable(fn):
+            return fn
+        if name not in self.functions:
+            label = '{}.{}'.format(self.module.__name__,name)
+            call = self.profile.call
+            self.functions[name] = lambda *args: call('userdef',label,fn,*args)
+        return self.functions[name]
+
+def timednamespace(profile):
+    ## globals for evaluation of expressions, with userdef functions timed
+    import util
+    namespace = dict(vars(util))
+    if 'userdef' in namespace:
+        namespace['userdef'] = timedmodule(profile,namespace['userdef'])
+    return namespace
@@ -30,10 +30,14 @@
 ## This code is nearly identical to https://github.com/stakahama/aprl-kpp-gp/blob/master/util/simpol2.py, except class is renamed.
 
 from collections import OrderedDict
-import pandas as pd
-import numpy as np
+import os
 import sys
 from argparse import ArgumentParser, RawTextHelpFormatter
+from tableio import formats, readtable, tablewriter
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 ## -----------------------------------------------------------------------------
 
@@ -44,6 +48,7 @@ parser = ArgumentParser(description='''
 Calculate properties using SIMPOL.1. Example usage:
 
 $ simpol.py -i apinene_SIMPOLgroups.csv -o apinene_props_298.csv -t 298.15
+$ simpol.py -s -i apinenemech.csv -o apinene_props_298.csv -t 298.15
 
 ''',formatter_class=RawTextHelpFormatter)
 
@@ -51,12 +56,30 @@ $ simpol.py -i apinene_SIMPOLgroups.csv -o apinene_props_298.csv -t 298.15
 
 parser.add_argument('-i','--inputfile',type=str,help='fragment table')
 parser.add_argument('-o','--outfile',type=str,default='properties.csv',help='')
-parser.add_argument('-t','--temp',type=float,default=298.15,help='')
+parser.add_argument('-t','--temp',type=float,nargs='+',default=[298.15],
+                    help='temperature(s) in K')
+parser.add_argument('-r','--temprange',type=float,nargs=3,metavar=('START','STOP','STEP'),
+                    help='range of temperatures in K, spaced by STEP (STOP included if on the grid); overrides --temp')
+parser.add_argument('-l','--layout',type=str,choices=['wide','long'],default='wide',
+                    help='one row per compound (wide) or per compound and temperature (long)')
+parser.add_argument('-f','--format',type=str,choices=formats,
+                    help='format of output file (default: from its extension, otherwise csv)')
+parser.add_argument('-s','--smiles',action='store_true',
+                    help='INPUTFILE contains SMILES strings (compound, SMILES); groups are matched in-process')
+parser.add_argument('-g','--groupfile',type=str,
+                    default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'SMARTSpatterns','SIMPOLgroups.csv'),
+                    help='file of SMARTS patterns for SIMPOL groups (with --smiles)')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes for matching (with --smiles; 0 for all cores)')
+parser.add_argument('-c','--chunksize',type=int,
+                    help='read SMILES strings and write properties in chunks of this many rows (with --smiles)')
 
 ## -----------------------------------------------------------------------------
 
 class SIMPOL1:
 
+    R = 8.3144622e-3 ## gas constant, kJ K^-1 mol^-1
+
     def __init__(self):
         table5 = [
             ('groups',[
@@ -129,14 +152,31 @@ class SIMPOL1:
     def get_groupnames(self):
         return self.table['groups']
 
+    def coefficients(self,temp):
+        ## b_k(T) and db_k(T)/d(1/T) for each group at temperature temp (K);
+        ##   for a sequence of temperatures, tables of groups x temperatures
+        if np.ndim(temp) == 0:
+            Bk1 = self.table['Bk,1']
+            Bk2 = self.table['Bk,2']
+            Bk3 = self.table['Bk,3']
+            Bk4 = self.table['Bk,4']
+        else:
+            temp = np.asarray(temp,dtype=float)
+            Bk1, Bk2, Bk3, Bk4 = [
+                self.table[[k]].values for k in ['Bk,1','Bk,2','Bk,3','Bk,4']
+                ] # column vectors which broadcast against temp
+        bk = Bk1/temp + Bk2 + Bk3*temp + Bk4*np.log(temp)
+        dbT = Bk1 - Bk3*temp**2 - Bk4*temp
+        if np.ndim(temp) > 0:
+            columns = pd.Index(temp,name='temperature')
+            bk = pd.DataFrame(bk,index=self.table['groups'],columns=columns)
+            dbT = pd.DataFrame(dbT,index=self.table['groups'],columns=columns)
+        return bk, dbT
+
     def p0_atm(self,nuk,temp):
         ## calculates vapor pressure from vector of abundances (nuk) and
         ##   temperature (temp in K)
-        Bk1 = self.table['Bk,1']
-        Bk2 = self.table['Bk,2']
-        Bk3 = self.table['Bk,3']
-        Bk4 = self.table['Bk,4']
-        bk = Bk1/temp + Bk2 + Bk3*temp + Bk4*np.log(temp)
+        bk, dbT = self.coefficients(temp)
         return 10**np.sum(nuk*bk)
 
     def deltaHvap_kJpermol(self,nuk,temp):
@@ -144,42 +184,123 @@ class SIMPOL1:
         ##   temperature (temp in K)
         ## R is the gas constant
         ## db is db(T)/d(1/T)
-        Bk1 = self.table['Bk,1']
-        Bk2 = self.table['Bk,2']
-        Bk3 = self.table['Bk,3']
-        Bk4 = self.table['Bk,4']
-        R = 8.3144622e-3 ## kJ K^-1 mol^-1
-        dbT = Bk1 - Bk3*temp**2 - Bk4*temp
-        return -2.303*R*np.sum(nuk*dbT)
+        bk, dbT = self.coefficients(temp)
+        return -2.303*self.R*np.sum(nuk*dbT)
 
-    def calc_properties(self,temp,index=None):
+    def properties(self,nuk,temp):
+        ## vapor pressure (atm) and enthalpy of vaporization (kJ/mol) from
+        ##   matrix of abundances (compounds x groups, in order of
+        ##   get_groupnames()); arrays of compounds (x temperatures if temp is
+        ##   a sequence)
+        nuk = np.asarray(nuk,dtype=float)
+        bk, dbT = self.coefficients(temp)
+        return (10**nuk.dot(np.asarray(bk)),
+                -2.303*self.R*nuk.dot(np.asarray(dbT)))
+
+    def tabulate(self,nuk,temp,index):
+        ## table of properties for matrix of abundances (nuk) with rows
+        ##   labeled by index; columns are (property, temperature) if temp is
+        ##   a sequence
+        p0, deltaH = self.properties(nuk,temp)
+        if np.ndim(temp) == 0:
+            return pd.DataFrame(OrderedDict([('p0',p0),('DeltaH',deltaH)]),index=index)
+        columns = pd.Index(temp,name='temperature')
+        return pd.concat(OrderedDict([
+            ('p0',pd.DataFrame(p0,index=index,columns=columns)),
+            ('DeltaH',pd.DataFrame(deltaH,index=index,columns=columns))
+            ]),axis=1,names=['property'])
+
+    def abundances(self,index=None):
         compounds = self.compounds
-        p0_atm = self.p0_atm
-        deltaHvap_kJpermol = self.deltaHvap_kJpermol
-        if not index:
+        if index is None:
             index = compounds.index
-        props = pd.DataFrame(np.tile(np.nan,(len(index),2)),
-                             index=index,
-                             columns=['p0','DeltaH'])
-        for idx in index:
-            abundances = compounds.ix[idx,self.table['groups']].values # preserve order of abundances
-            props.ix[idx,'p0'] = p0_atm(abundances,temp)
-            props.ix[idx,'DeltaH'] = deltaHvap_kJpermol(abundances,temp)
-        return props
+        return compounds.loc[index,self.table['groups']].values, index # preserve order of abundances
+
+    def calc_properties(self,temp,index=None):
+        ## properties of all compounds (or those in index) at once: the
+        ##   coefficient vectors are evaluated once and applied to the matrix
+        ##   of abundances (compounds x groups)
+        nuk, index = self.abundances(index)
+        return self.tabulate(nuk,temp,index)
+
+    def calc_properties_sweep(self,temps,index=None):
+        ## properties of all compounds (or those in index) at each of the
+        ##   temperatures in temps, from a single product of the matrix of
+        ##   abundances (compounds x groups) and the coefficient matrices
+        ##   (groups x temperatures). Columns are (property, temperature).
+        nuk, index = self.abundances(index)
+        return self.tabulate(nuk,np.asarray(temps,dtype=float),index)
 
     def read_compounds(self,filename):
-        compounds = pd.read_csv(filename)
+        compounds = readtable(filename)
         if compounds.shape[0] > compounds.drop_duplicates().shape[0]:
             sys.exit('USER ERROR: duplicate rows in input matrix')
         self.compounds = compounds.set_index('compound')
 
+def count_groups(simp,inputfile,groupfile,jobs=1,chunksize=None):
+    ## match SIMPOL groups in a file of SMILES strings (compound, SMILES) and
+    ##   yield abundances as dense integer arrays (compounds x groups, in
+    ##   order of simp.get_groupnames()) with their compound index, one chunk
+    ##   at a time; no intermediate table of groups is written or read
+    from util import searchgroups, searchpool, mapsearch, readinput
+    groupnames = simp.get_groupnames().tolist()
+    groups = pd.read_csv(groupfile).drop_duplicates().set_index('substructure')
+    search = searchgroups(groups.pattern,groupnames)
+    pool = searchpool(search,jobs) if jobs != 1 else None
+    try:
+        for inp in readinput(inputfile,chunksize):
+            counts = mapsearch(search,'count',inp.SMILES,jobs,pool=pool)
+            nuk = np.empty((len(counts),len(groupnames)),dtype=int)
+            for i, x in enumerate(counts):
+                nuk[i] = x.values
+            yield nuk, inp.index
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def temperatures(temp,temprange=None):
+    ## temperatures of temp, or of temprange (START, STOP, STEP): spaced by
+    ##   exactly STEP from START, up to STOP (included if it falls on the grid)
+    if temprange:
+        start, stop, step = temprange
+        if step <= 0 or stop < start:
+            raise ValueError('temperature range requires STEP > 0 and STOP >= START')
+        return start+step*np.arange(int(np.floor((stop-start)/step+1e-9))+1)
+    return np.asarray(temp,dtype=float)
+
+def widen(props):
+    ## flatten (property, temperature) columns to property_temperature
+    props.columns = ['{}_{:g}'.format(*x) for x in props.columns]
+    return props
+
+def lengthen(props):
+    return props.stack('temperature').reset_index('temperature')[['temperature','p0','DeltaH']]
+
 if __name__=='__main__':
 
     ## parse arguments
     args = parser.parse_args()
+    if args.temprange and (args.temprange[2] <= 0 or args.temprange[1] < args.temprange[0]):
+        parser.error('--temprange requires STEP > 0 and STOP >= START')
+    temps = temperatures(args.temp,args.temprange)
 
-    ## estimate properties
+    ## abundances
     simp = SIMPOL1()
-    simp.read_compounds(args.inputfile)
-    out = simp.calc_properties(args.temp)
-    out.reset_index().to_csv(args.outfile,index=False)
+    if args.smiles:
+        chunks = count_groups(simp,args.inputfile,args.groupfile,args.jobs,args.chunksize)
+    else:
+        simp.read_compounds(args.inputfile)
+        chunks = [simp.abundances()]
+
+    ## estimate properties
+    if len(temps)==1 and args.layout=='wide':
+        reshape, temp = (lambda x: x), temps[0]
+    elif args.layout=='wide':
+        reshape, temp = widen, temps
+    else:
+        reshape, temp = lengthen, temps
+    writer = tablewriter(args.outfile,args.format)
+    for nuk, index in chunks:
+        writer.write(reshape(simp.tabulate(nuk,temp,index)).reset_index())
+    writer.close()
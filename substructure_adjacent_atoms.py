@@ -27,32 +27,215 @@
 
 import os
 import re
-import pybel
-import openbabel
-import pandas as pd
+import sys
+from molstore import readmolecule
 from collections import OrderedDict
 from argparse import ArgumentParser, RawTextHelpFormatter
-from util import searchgroups
+from util import searchgroups, readinput
+from tableio import formats, tablewriter
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
+## Open Babel bindings are used through pybel.ob (openbabel is not loaded
+##   lazily since it may replace itself in sys.modules)
 ## import igraph ## didn't need
 
 ###_* --- Define command-line arguments
 
 parser = ArgumentParser(description='''
 ============================================================
-Find adjacent atoms and bond order for each atom.
-Example usage:
+Find adjacent atoms and bond order for each atom. Output files with extension
+.npz or .arrow are written as compact (CSR) graphs for each compound, with atom
+types in {stem}_atomtypes.csv. Example usage:
 
 $ python substructure_adjacent_atoms.py -i apinenemech.csv -o apinenemech_adjacent_atoms.csv
 
+$ python substructure_adjacent_atoms.py -i apinenemech.csv -o apinenemech_adjacent_atoms.arrow -u
+
 ''',formatter_class=RawTextHelpFormatter)
 
 ###_ . Arguments
 
 parser.add_argument('-i','--inputfile',type=str,
-                    help='file of SMILES strings (label, SMILES); csv format')
+                    help='file of SMILES strings (label, SMILES); csv, parquet or feather format')
 parser.add_argument('-o','--outputfile',type=str,default='output',
                     help='output file name')
+parser.add_argument('-f','--format',type=str,choices=formats,
+                    help='format of output file (default: from its extension, otherwise csv)')
+parser.add_argument('-c','--chunksize',type=int,
+                    help='read SMILES strings and write output in chunks of this many rows')
+
+###_ . Flags (on/off):
+parser.add_argument('-u','--undirected',action='store_true',
+                    help='write each bond once (atom1 < atom2) rather than once in each direction')
+
+
+## http://openbabel.org/docs/dev/UseTheLibrary/Python_PybelAPI.html
+## http://openbabel.org/docs/dev/UseTheLibrary/PythonExamples.html
+## http://openbabel.org/dev-api/classOpenBabel_1_1OBAtom.shtml
+
+## pyatom.idx == obatom.GetIdx()
+## pyatom.idx != obatom.GetIndex()
+
+edgecolumns = ['compound', 'atom1', 'atom2', 'atom1_type', 'atom2_type', 'bondorder']
+
+def adjacentatoms(compound,mol,undirected=False):
+    ## list of (compound, atom1, atom2, atom1_type, atom2_type, bondorder)
+    ##   for each directed edge (for each bond, if undirected)
+    edgelist = []
+    for pyatom in mol.atoms:
+        obatom = pyatom.OBAtom
+        idx1 = obatom.GetIdx()
+        atype1 = obatom.GetType()
+        for neighbor in pybel.ob.OBAtomAtomIter(obatom):
+            idx2 = neighbor.GetIdx()
+            if undirected and idx2 < idx1:
+                continue
+            atype2 = neighbor.GetType()
+            bond = obatom.GetBond(neighbor)
+            bondorder = bond.GetBondOrder()
+            edgelist.append((compound, idx1, idx2, atype1, atype2, bondorder))
+    return edgelist
+
+###_* --- Compact graphs
+
+## Adjacency of each compound as a CSR graph: atom types (uint16 codes of the
+##   dictionary in {stem}_atomtypes.csv, for atoms in order of index), offsets
+##   of the neighbors of each atom (int32, number of atoms + 1), neighbors
+##   (int32, atom indices from 1, in the order of the rows of the table above)
+##   and bond orders (uint8).
+##
+## Arrow (IPC) files have one row per compound with columns {compound,
+##   atomtype, offsets, neighbor, bondorder} (lists) and are appended to as
+##   each chunk is written. npz files hold the arrays of all compounds
+##   concatenated (atomoffsets locates the atoms of each compound and
+##   edgeoffsets the neighbors of each atom) and are written when closed.
 
+graphformats = OrderedDict([('npz','.npz'),('arrow','.arrow')])
+graphcolumns = ['compound','atomtype','offsets','neighbor','bondorder']
+
+def graphformat(filename):
+    ## 'npz' or 'arrow' from the extension of filename, otherwise None
+    extension = os.path.splitext(filename)[1].lower()
+    return next((k for k, v in graphformats.items() if v==extension),None)
+
+def atomtypefile(filename):
+    return os.path.splitext(filename)[0]+'_atomtypes.csv'
+
+def adjacency(mol,undirected=False):
+    ## (atom types, offsets, neighbors, bond orders) of a molecule
+    atomtypes, offsets, neighbors, bondorders = [], [0], [], []
+    for obatom in pybel.ob.OBMolAtomIter(mol.OBMol):
+        idx = obatom.GetIdx()
+        atomtypes.append(obatom.GetType())
+        for bond in pybel.ob.OBAtomBondIter(obatom):
+            neighbor = bond.GetNbrAtomIdx(obatom)
+            if undirected and neighbor < idx:
+                continue
+            neighbors.append(neighbor)
+            bondorders.append(bond.GetBondOrder())
+        offsets.append(len(neighbors))
+    return (atomtypes,
+            np.array(offsets,dtype=np.int32),
+            np.array(neighbors,dtype=np.int32),
+            np.array(bondorders,dtype=np.uint8))
+
+def _concatenate(arrays,dtype):
+    return np.concatenate(arrays).astype(dtype) if arrays else np.array([],dtype=dtype)
+
+def _offsets(lengths):
+    offsets = np.concatenate([[0],np.cumsum(lengths,dtype=np.int64)])
+    if offsets[-1] > np.iinfo(np.int32).max:
+        sys.exit('ERROR: more than 2**31-1 atoms or edges; write chunks to Arrow (.arrow) files')
+    return offsets.astype(np.int32)
+
+class graphwriter:
+
+    def __init__(self,filename,undirected=False):
+        self.filename = filename
+        self.fmt = graphformat(filename)
+        self.undirected = undirected
+        self.codes = OrderedDict() # atom type -> code
+        self.writer = None
+        self.chunks = []
+
+    def write(self,compounds,molecules):
+        ## compounds and their molecules (pybel)
+        graphs = [adjacency(mol,self.undirected) for mol in molecules]
+        codes = [np.array([self.codes.setdefault(x,len(self.codes)) for x in graph[0]],dtype=np.uint16)
+                 for graph in graphs]
+        arrays = [codes]+[[graph[i] for graph in graphs] for i in range(1,4)]
+        if self.fmt=='arrow':
+            self.__writebatch(list(compounds),arrays)
+        else:
+            ## numbers of atoms and neighbors, from which offsets are
+            ##   computed when closed
+            self.chunks.append([np.array(list(compounds),dtype=str),
+                                np.array([len(x) for x in codes],dtype=np.int64),
+                                _concatenate(codes,np.uint16),
+                                _concatenate([np.diff(x) for x in arrays[1]],np.int64),
+                                _concatenate(arrays[2],np.int32),
+                                _concatenate(arrays[3],np.uint8)])
+
+    def __writebatch(self,compounds,arrays):
+        import pyarrow as pa
+        types = [pa.uint16(),pa.int32(),pa.int32(),pa.uint8()]
+        columns = [pa.array(compounds,pa.string())]
+        for values, dtype in zip(arrays,types):
+            offsets = pa.array(_offsets([len(x) for x in values]))
+            columns.append(pa.ListArray.from_arrays(
+                offsets,pa.array(_concatenate(values,dtype.to_pandas_dtype()),dtype)))
+        batch = pa.RecordBatch.from_arrays(columns,graphcolumns)
+        if self.writer is None:
+            self.writer = pa.ipc.new_file(self.filename,batch.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        elif self.fmt=='npz':
+            dtypes = [str,np.int64,np.uint16,np.int64,np.int32,np.uint8]
+            compounds, natoms, codes, degrees, neighbors, bondorders = [
+                _concatenate([chunk[i] for chunk in self.chunks],dtype) for i, dtype in enumerate(dtypes)]
+            np.savez_compressed(self.filename,
+                                compound=compounds,
+                                atomoffsets=_offsets(natoms),
+                                atomtype=codes,
+                                edgeoffsets=_offsets(degrees),
+                                neighbor=neighbors,
+                                bondorder=bondorders)
+            self.chunks = []
+        pd.DataFrame({'atomtype':list(self.codes.keys())}).to_csv(atomtypefile(self.filename),index=False)
+
+def readgraph(filename):
+    ## arrays of a graph file in the layout of npz files (compound,
+    ##   atomoffsets, atomtype, edgeoffsets, neighbor, bondorder) and the
+    ##   atom types (Index) of the codes in atomtype
+    atomtypes = pd.Index(pd.read_csv(atomtypefile(filename),keep_default_na=False)['atomtype'])
+    if graphformat(filename)=='npz':
+        with np.load(filename) as f:
+            return {k:f[k] for k in f.files}, atomtypes
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    with pa.memory_map(filename) as source:
+        table = pa.ipc.open_file(source).read_all()
+    lists = {k:table.column(k).combine_chunks() for k in graphcolumns[1:]}
+    flat = {k:v.flatten().to_numpy(zero_copy_only=False) for k, v in lists.items()}
+    natoms = pc.list_value_length(lists['atomtype']).to_numpy(zero_copy_only=False)
+    ## numbers of neighbors are differences of offsets within each compound
+    degrees = np.diff(flat['offsets'])
+    keep = np.ones(len(degrees),dtype=bool)
+    keep[(np.cumsum(natoms+1)-1)[:-1]] = False
+    return OrderedDict([
+        ('compound',table.column('compound').to_numpy().astype(str)),
+        ('atomoffsets',_offsets(natoms)),
+        ('atomtype',flat['atomtype'].astype(np.uint16)),
+        ('edgeoffsets',_offsets(degrees[keep])),
+        ('neighbor',flat['neighbor'].astype(np.int32)),
+        ('bondorder',flat['bondorder'].astype(np.uint8)),
+        ]), atomtypes
 
 if __name__=='__main__':
 
@@ -63,31 +246,21 @@ if __name__=='__main__':
     ## for debugging
     ## args = parser.parse_args('-i examples/example_main.csv -o output.csv'.split())
 
-###_* --- Read SMILES file
-    inp = pd.read_csv(args.inputfile).drop_duplicates().set_index('compound')[['SMILES']]
+###_* --- Read SMILES file and export adjacency of each chunk
 
-## http://openbabel.org/docs/dev/UseTheLibrary/Python_PybelAPI.html
-## http://openbabel.org/docs/dev/UseTheLibrary/PythonExamples.html
-## http://openbabel.org/dev-api/classOpenBabel_1_1OBAtom.shtml
+    if graphformat(args.outputfile):
+        writer = graphwriter(args.outputfile, args.undirected)
+    else:
+        writer = tablewriter(args.outputfile, args.format)
 
-## pyatom.idx == obatom.GetIdx()
-## pyatom.idx != obatom.GetIndex()
+    for inp in readinput(args.inputfile, args.chunksize):
+        molecules = [readmolecule(x) for x in inp.SMILES]
+        if isinstance(writer, graphwriter):
+            writer.write(inp.index, molecules)
+            continue
+        edgelist = []
+        for compound, mol in zip(inp.index, molecules):
+            edgelist += adjacentatoms(compound, mol, args.undirected)
+        writer.write(pd.DataFrame(edgelist, columns=edgecolumns))
 
-    edgelist = []
-    for compound in inp.index:
-        mol = pybel.readstring('smi', inp.SMILES.ix[compound])
-        mol.addh()
-        for pyatom in mol.atoms:
-            obatom = pyatom.OBAtom
-            idx1 = obatom.GetIdx()
-            atype1 = obatom.GetType()
-            for neighbor in openbabel.OBAtomAtomIter(obatom):
-                idx2 = neighbor.GetIdx()
-                atype2 = neighbor.GetType()
-                bond = obatom.GetBond(neighbor)
-                bondorder = bond.GetBondOrder()
-                edgelist.append((compound, idx1, idx2, atype1, atype2, bondorder))
-
-    edgeframe = pd.DataFrame(edgelist, columns=['compound', 'atom1', 'atom2', 'atom1_type', 'atom2_type', 'bondorder'])
-
-    edgeframe.to_csv(args.outputfile, index=False)
+    writer.close()
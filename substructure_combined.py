@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## substructure_combined.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+import os
+import sys
+from collections import OrderedDict
+from argparse import ArgumentParser, RawTextHelpFormatter
+import molstore
+from util import patternset, searchgroups, mapsearch, readinput
+from substructure_generate_fulltable import fulltablewriter, duplicatesmiles
+from substructure_adjacent_atoms import adjacentatoms, edgecolumns, graphformat, graphwriter
+from substructure_molecular_attributes import queryattr
+from tableio import tablewriter, matrixwriter, matrixextension
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+
+###_* --- Define command-line arguments
+
+parser = ArgumentParser(description='''
+============================================================
+Write outputs of substructure_search.py, substructure_generate_fulltable.py,
+substructure_adjacent_atoms.py and substructure_molecular_attributes.py in a
+single pass over the compounds; each SMILES string is parsed once for all
+outputs. Output files are written in csv, parquet or feather format according
+to their extension (.csv, .parquet, .feather); substructures, atomcounts and
+groupcounts files with extension .npz are written as sparse (CSR) matrices, and
+adjacent files with extension .npz or .arrow as compact (CSR) graphs.
+Requires a file of SMILES strings and a manifest (csv) with columns {output,
+file, groupfile, export, attributes}. Values of output:
+
+  substructures   compound x substructure counts (substructure_search.py);
+                    requires groupfile, optional export
+  atomfulltable,  tables of substructure_generate_fulltable.py;
+  atomcounts,       requires groupfile
+  groupcounts,
+  atomicmass,
+  atomindex
+  adjacent        adjacent atoms and bond orders (substructure_adjacent_atoms.py)
+  attributes      molecular attributes (substructure_molecular_attributes.py);
+                    requires attributes (comma-separated, no spaces)
+
+Example usage:
+
+$ python substructure_combined.py -d -m example_manifest.csv -i example_main.csv
+
+''',formatter_class=RawTextHelpFormatter)
+
+###_ . Arguments
+
+parser.add_argument('-m','--manifest',type=str,
+                    help='file of requested outputs (output, file, groupfile, export, attributes); csv format')
+parser.add_argument('-i','--inputfile',type=str,
+                    help='file of SMILES strings (compound, SMILES); csv, parquet or feather format')
+parser.add_argument('-c','--chunksize',type=int,default=1000,
+                    help='number of compounds processed (and appended to outputs) at a time')
+
+###_ . Flags (on/off):
+parser.add_argument('-d','--default-directory',action='store_true',
+                    help='groupfile and export exist in SMARTSpatterns/')
+
+fulltableoutputs = ['atomfulltable','atomcounts','groupcounts','atomicmass','atomindex']
+
+###_* --- Functions
+
+def readexport(exportfile):
+    with open(exportfile) as f:
+        return [x.strip('"\'\n') for x in f]
+
+def searchtask(search,writer):
+    def write(inp):
+        output = pd.DataFrame(mapsearch(search,'count',inp.SMILES),index=inp.index)
+        writer.write(output,index_label='compound')
+    return write
+
+def adjacenttask(writer):
+    def write(inp):
+        if isinstance(writer,graphwriter):
+            writer.write(inp.index,[molstore.readmolecule(x) for x in inp.SMILES])
+            return
+        edgelist = []
+        for compound, smiles in zip(inp.index,inp.SMILES):
+            edgelist += adjacentatoms(compound,molstore.readmolecule(smiles))
+        writer.write(pd.DataFrame(edgelist,columns=edgecolumns))
+    return write
+
+def attributestask(attributes,writer):
+    query = queryattr(attributes.split(','))
+    def write(inp):
+        writer.write(inp.SMILES.apply(query.getattributes),index_label='compound')
+    return write
+
+if __name__=='__main__':
+
+###_* --- Parse arguments
+
+    args = parser.parse_args()
+
+    ## pattern directory
+    if args.default_directory:
+        ddirectory = os.path.join(os.path.dirname(__file__),'SMARTSpatterns')
+    else:
+        ddirectory = ''
+
+###_* --- Read manifest
+
+    manifest = pd.read_csv(args.manifest,dtype=str)
+    for var in ['groupfile','export','attributes']:
+        if var not in manifest.columns:
+            manifest[var] = None
+    manifest = manifest.where(manifest.notnull(),None)
+
+    ## patterns are compiled once per group file
+    patterns = OrderedDict()
+    for groupfile in manifest['groupfile'].dropna().unique():
+        groups = pd.read_csv(os.path.join(ddirectory,groupfile)).drop_duplicates().set_index('substructure')
+        if 'export' not in groups.columns:
+            groups['export'] = 1
+        patterns[groupfile] = (groups,patternset(groups.pattern))
+
+###_* --- Define tasks
+
+    tasks = []
+    files = []    # tablewriter and fulltablewriter objects, closed at the end
+    fulltables = OrderedDict()
+    for row in manifest.itertuples(index=False):
+        if row.output in fulltableoutputs or row.output=='substructures':
+            if row.groupfile is None:
+                sys.exit('USER ERROR: groupfile required for output "{}"'.format(row.output))
+            groups, compiled = patterns[row.groupfile]
+        if row.output=='substructures':
+            if row.export:
+                export = readexport(os.path.join(ddirectory,row.export))
+            elif 'export' in groups.columns:
+                export = groups.index[groups['export'].astype('bool')]
+            if row.file.endswith(matrixextension):
+                files.append(matrixwriter(row.file))
+            else:
+                files.append(tablewriter(row.file))
+            tasks.append(searchtask(searchgroups(compiled,export),files[-1]))
+        elif row.output in fulltableoutputs:
+            ## outputs for the same group file share one writer
+            fulltables.setdefault(row.groupfile,OrderedDict())[row.output] = row.file
+        elif row.output=='adjacent':
+            files.append(graphwriter(row.file) if graphformat(row.file) else tablewriter(row.file))
+            tasks.append(adjacenttask(files[-1]))
+        elif row.output=='attributes':
+            if row.attributes is None:
+                sys.exit('USER ERROR: attributes required for output "attributes"')
+            files.append(tablewriter(row.file))
+            tasks.append(attributestask(row.attributes,files[-1]))
+        else:
+            sys.exit('USER ERROR: unknown output "{}"'.format(row.output))
+
+    if fulltables:
+        duplicates = duplicatesmiles(readinput(args.inputfile,args.chunksize))
+    for groupfile, outputfiles in fulltables.items():
+        groups, compiled = patterns[groupfile]
+        search = searchgroups(compiled,groups.export)
+        files.append(fulltablewriter(outputfiles,duplicates))
+        tasks.append((lambda search, writer: lambda inp: writer.add(search,inp))(search,files[-1]))
+
+###_* --- Single pass over compounds
+
+    ## molecules of a chunk are retained for all tasks
+    molstore.default.maxsize = max(molstore.default.maxsize,args.chunksize)
+
+    for inp in readinput(args.inputfile,args.chunksize):
+        for task in tasks:
+            task(inp)
+
+    for writer in files:
+        writer.close()
@@ -27,12 +27,18 @@
 
 import os
 import re
-import pybel
-import pandas as pd
-from collections import OrderedDict
+import pickle
+import tempfile
+from collections import OrderedDict, defaultdict
 from argparse import ArgumentParser, RawTextHelpFormatter
-from util import searchgroups
+from util import searchgroups, mapsearch, searchpool, readinput
+from tableio import formats, extensions, tablewriter, layouts, matrixextension, countmatrix, writematrix
 from functools import reduce
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 ###_* --- Define command-line arguments
 
@@ -51,16 +57,221 @@ $ python substructure_generate_fulltable.py -d -g MCMgroups.csv -i apinenemech.c
 parser.add_argument('-g','--groupfile',type=str,
                     help='file of SMARTS patterns (substructure, pattern); csv format')
 parser.add_argument('-i','--inputfile',type=str,
-                    help='file of SMILES strings (label, SMILES); csv format')
+                    help='file of SMILES strings (label, SMILES); csv, parquet or feather format')
 parser.add_argument('-o','--outputprefix',type=str,default='output',
                     help='output prefix')
 parser.add_argument('-e','--export',type=str,
                     help='text file with list of compounds to select in a single column')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes (0 for all cores)')
+parser.add_argument('--cache',type=str,
+                    help='file of cached results (SQLite) to read from and add to')
+parser.add_argument('--cache-size',type=int,default=1000000,
+                    help='maximum number of entries retained in --cache')
+parser.add_argument('-c','--chunksize',type=int,
+                    help='read SMILES strings and write atom tables in chunks of this many rows')
+parser.add_argument('-f','--format',type=str,choices=formats,default='csv',
+                    help='format of output files')
+parser.add_argument('-s','--sparse',type=str,choices=layouts,
+                    help='write atom and group counts as sparse matrices (.npz) in this layout')
+parser.add_argument('-x','--atomindex',action='store_true',
+                    help='also write the atom table sorted by compound with an index of rows of each compound ({prefix}_atomindex.bin), for reading of selected compounds')
+parser.add_argument('--profile',type=str,nargs='?',const='',metavar='PROFILEFILE',
+                    help='record time, calls and matches of each pattern; report is printed, or written to PROFILEFILE')
 
 ###_ . Flags (on/off):
 parser.add_argument('-d','--default-directory',action='store_true',
                     help='--groupfile exists in SMARTSpatterns/')
 
+###_* --- Functions
+
+def matchtable(search,inp,jobs=1,pool=None,cache=None):
+    ## table of atoms and matched groups for compounds in inp, and set of
+    ##   (atomtype, atomicmass) for matched atoms
+    ##   the tables of each compound are kept as columns and concatenated
+    ##   into a single DataFrame for the batch
+    columns = OrderedDict()
+    masslist = []
+    smileslist = inp.SMILES.unique()
+    searchfn = mapsearch if cache is None else cache.mapsearch
+    matched = searchfn(search,'matchatoms',smileslist,jobs,pool=pool)
+    for smiles, (indextable, masstable) in zip(smileslist,matched):
+        for k, v in indextable.items():
+            columns.setdefault(k,[]).append(v)
+        columns.setdefault('SMILES',[]).append(np.repeat(smiles,len(v)))
+        masslist.append(masstable)
+    indextable = pd.DataFrame(OrderedDict(
+        (k,np.concatenate(v)) for k, v in columns.items()))
+    master = pd.merge(inp.reset_index(),indextable,
+                      on='SMILES',how='outer')
+    del master['SMILES']
+    return master, reduce(set.union,masslist)
+
+## counts of unique atoms (matches) of each type (group) in each compound,
+##   as Series indexed by (compound, type or group) with nonzero counts only,
+##   and the types (groups) of all atoms in master
+countvars = OrderedDict([('atoms',('type','atom')), ('groups',('group','match'))])
+
+def countrecords(master):
+    ismatched = master['group'].notnull()
+    records = {}
+    for k, (column, var) in countvars.items():
+        counts = (
+            master
+            .loc[ismatched, ['compound', column, var]]
+            .drop_duplicates()
+            .groupby(['compound', column], observed=True)[var].count()
+            )
+        records[k] = (counts, master[column].dropna().unique())
+    return records
+
+## create tables of counts: number of unique atoms (matches) of each type
+##   (group) in each compound. Types of atoms not in any match are retained
+##   as columns with counts of zero
+def counttables(master,index):
+    tables = {}
+    for k, (counts, columns) in countrecords(master).items():
+        tables[k] = widecounts(counts,index,sorted(columns))
+    return tables
+
+def widecounts(counts,index,columns):
+    return (
+        counts
+        .unstack(level=1, fill_value=0)
+        .reindex(index=index, columns=columns, fill_value=0)
+        )
+
+def float2int(df,columns=None):
+    if not columns:
+        columns = df.columns
+    for var in columns:
+        df[var] = df[var].map('{:.0f}'.format)
+    return df
+
+def formatatoms(master,fmt):
+    ## atom table as written to file in fmt
+    if fmt=='csv':
+        return float2int(master,['atom','match'])
+    return master.astype({'atom':'Int64','match':'Int64'})
+
+def formatcounts(widef,columns):
+    ## count table as written to file, with given columns (sorted)
+    return float2int(widef.reindex(columns=sorted(columns),fill_value=0))
+
+def duplicatesmiles(chunks):
+    ## in the atom table, compounds sharing a SMILES string are grouped with
+    ##   the first compound having that string. Returns the chunk in which
+    ##   each SMILES string (by hash) first appears, and for each chunk, the
+    ##   compounds in later chunks which share a SMILES string with it.
+    first = {}
+    later = defaultdict(lambda: defaultdict(list))
+    for i, inp in enumerate(chunks):
+        hashed = pd.util.hash_array(inp.SMILES.values)
+        for compound, smiles, h in zip(inp.index,inp.SMILES,hashed):
+            j = first.setdefault(h,i)
+            if j < i:
+                later[j][smiles].append(compound)
+    return first, later
+
+class fulltablewriter:
+
+    ## writes output tables for chunks of compounds as they are matched. The
+    ##   atom table is appended to directly; counts are spooled to a
+    ##   temporary file since their columns (the union over all chunks) are
+    ##   only known after the last chunk. outputfiles may contain any of
+    ##   'atomcounts', 'groupcounts', 'atomicmass', 'atomfulltable'. Tables
+    ##   are written in fmt (see tableio.py; by default from file extensions);
+    ##   counts and indices are formatted as integers only for csv files.
+    ##   Count tables with .npz files are written as sparse matrices in
+    ##   layout ('csr' or 'coo'), summed from the spooled counts. An
+    ##   'atomindex' file is written with atomindex.atomindexwriter.
+
+    countfiles = OrderedDict([('atoms','atomcounts'),('groups','groupcounts')])
+
+    def __init__(self,outputfiles,duplicates=None,fmt=None,layout='csr'):
+        ## duplicates is the output of duplicatesmiles() when chunked
+        self.outputfiles = outputfiles
+        self.sparse = [k for k, v in outputfiles.items()
+                       if k in self.countfiles.values() and v.endswith(matrixextension)]
+        self.writers = {k:tablewriter(v,fmt) for k, v in outputfiles.items()
+                        if k not in self.sparse and k != 'atomindex'}
+        if 'atomindex' in outputfiles:
+            from atomindex import atomindexwriter
+            self.index = atomindexwriter(outputfiles['atomindex'])
+        else:
+            self.index = None
+        self.layout = layout
+        self.first, self.later = duplicates or ({}, {})
+        self.spool = tempfile.TemporaryFile()
+        self.columns = {k:set() for k in self.countfiles.keys()}
+        self.masses = set()
+        self.nchunks = 0
+
+    def add(self,search,inp,jobs=1,pool=None,cache=None):
+        i = self.nchunks
+        first, later = self.first, self.later
+        index = inp.index
+        hashed = pd.util.hash_array(inp.SMILES.values)
+        inp = inp[['SMILES']].assign(write=[first.get(h,i)==i for h in hashed])
+        extra = [(compound,smiles) for smiles, compounds in later.get(i,{}).items()
+                 for compound in compounds]
+        if extra:
+            extra = pd.DataFrame(extra,columns=['compound','SMILES']).set_index('compound')
+            inp = pd.concat([inp,extra.assign(write=True)])
+        master, masstable = matchtable(search,inp,jobs,pool,cache)
+        records = countrecords(master)
+        for k in self.countfiles.keys():
+            self.columns[k].update(records[k][1])
+        ## compounds of later chunks sharing SMILES strings are counted there
+        counts = {k:v[0].loc[v[0].index.get_level_values(0).isin(index)]
+                  for k, v in records.items()}
+        pickle.dump((index,counts),self.spool,pickle.HIGHEST_PROTOCOL)
+        self.masses.update(masstable)
+        master = master.loc[master.pop('write').astype(bool)]
+        if self.index is not None:
+            self.index.write(master)
+        if 'atomfulltable' in self.writers:
+            writer = self.writers['atomfulltable']
+            writer.write(formatatoms(master,writer.fmt))
+        self.nchunks += 1
+
+    def close(self):
+        writers = self.writers
+        columns = {k:sorted(v) for k, v in self.columns.items()}
+        rows, records = [], {k:[] for k in self.countfiles.keys()}
+        self.spool.seek(0)
+        for i in range(self.nchunks):
+            index, counts = pickle.load(self.spool)
+            for k, outfile in self.countfiles.items():
+                if outfile in self.sparse:
+                    records[k].append(counts[k])
+                if outfile not in writers:
+                    continue
+                widef = widecounts(counts[k],index,columns[k])
+                if writers[outfile].fmt=='csv':
+                    widef = formatcounts(widef,columns[k])
+                writers[outfile].write(widef,index_label='compound')
+            rows.append(index)
+        self.spool.close()
+        if self.sparse and rows:
+            rows = rows[0].append(rows[1:]).rename('compound')
+            for k, outfile in self.countfiles.items():
+                if outfile not in self.sparse:
+                    continue
+                counts = pd.concat(records[k])
+                matrix = countmatrix(counts.index.get_level_values(0),counts.index.get_level_values(1),
+                                     rows,columns[k],counts.values.astype(np.int32))
+                writematrix(matrix,rows,pd.Index(columns[k],name=countvars[k][0]),
+                            self.outputfiles[outfile],self.layout)
+        if 'atomicmass' in writers:
+            atomicmass = pd.DataFrame(list(self.masses),
+                                      columns=['atomtype','atomicmass']).set_index('atomtype')
+            writers['atomicmass'].write(atomicmass,index_label='atom')
+        for writer in writers.values():
+            writer.close()
+        if self.index is not None:
+            self.index.close()
+
 if __name__=='__main__':
 
 ###_* --- Parse arguments
@@ -86,60 +297,59 @@ if __name__=='__main__':
         groups['export'] = 1
 
 ###_ . SMILES
-    inp = pd.read_csv(args.inputfile).drop_duplicates().set_index('compound')[['SMILES']]
-
-###_* --- Apply search function
+    chunks = readinput(args.inputfile,args.chunksize)
 
-    ## query tables
-    search = searchgroups(groups.pattern,groups.export)
-    dflist = []
-    masslist = []
-    for smiles in inp.SMILES.unique():
-        indextable, masstable = search.matchatoms(smiles)
-        indextable['SMILES'] = smiles
-        dflist.append(indextable)
-        masslist.append(masstable)
-    master = pd.merge(inp.reset_index(),pd.concat(dflist),
-                      on='SMILES',how='outer')
-    del master['SMILES']
-    atomicmass = pd.DataFrame(list(reduce(set.union,masslist)),
-                              columns=['atomtype','atomicmass']).set_index('atomtype')
-
-    ## create tables of counts
-    def docount(var,req_uniq='group'):
-        def fn(df):
-            return len(df[var].ix[df[req_uniq].notnull()].unique())
-        return fn
-
-    param = {'atoms':('type','atom'), 'groups':('group','match')}
-    tables = {}
-    for k in param.keys():
-        grouped = master.groupby(['compound',param[k][0]])
-        counts = grouped.apply(docount(param[k][1])).reset_index(name='count')
-        widef = counts.pivot_table(index='compound',columns=param[k][0],values='count').ix[inp.index]
-        widef.fillna(0,inplace=True)
-        tables[k] = widef
-
-###_* --- Export to output
-
-    def float2int(df,columns=None):
-        if not columns:
-            columns = df.columns
-        for var in columns:
-            df[var] = df[var].map('{:.0f}'.format)
-        return df
+###_* --- Output files
 
     outpath = os.path.dirname(args.outputprefix)
     prefix = os.path.basename(args.outputprefix)
-    extension = '.csv'
+    extension = extensions[args.format]
     filename = '{}_{}{}'
     outputfiles = {
         k:os.path.join(outpath,filename.format(prefix,k,extension)) for k in
         ['atomcounts','groupcounts','atomicmass','atomfulltable']
         }
+    if args.sparse:
+        for k in fulltablewriter.countfiles.values():
+            outputfiles[k] = os.path.join(outpath,filename.format(prefix,k,matrixextension))
+    if args.atomindex:
+        from atomindex import extension as indexextension
+        outputfiles['atomindex'] = os.path.join(outpath,filename.format(prefix,'atomindex',indexextension))
+
+###_* --- Apply search function and export to output
+
+    if args.profile is not None:
+        from profiling import searchprofile
+        profile = searchprofile()
+    else:
+        profile = None
+    search = searchgroups(groups.pattern,groups.export,profile=profile)
+    pool = searchpool(search,args.jobs) if args.jobs != 1 else None
+    if args.cache:
+        from cache import resultcache
+        cache = resultcache(args.cache,args.cache_size)
+    else:
+        cache = None
+    if args.chunksize:
+        duplicates = duplicatesmiles(readinput(args.inputfile,args.chunksize))
+    else:
+        duplicates = None
+    writer = fulltablewriter(outputfiles,duplicates,args.format,args.sparse)
+    try:
+        for inp in chunks:
+            writer.add(search,inp,args.jobs,pool,cache)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.evict()
+            print(cache.stats())
+            cache.close()
+    writer.close()
 
-    float2int(tables['atoms']).to_csv(outputfiles['atomcounts'],index_label='compound')
-    float2int(tables['groups']).to_csv(outputfiles['groupcounts'],index_label='compound')
-    atomicmass.to_csv(outputfiles['atomicmass'],index_label='atom')
-    master = float2int(master,['atom','match'])
-    master.to_csv(outputfiles['atomfulltable'],index=False)
+    if profile is not None:
+        if args.profile:
+            profile.write(args.profile)
+        else:
+            print(profile.report())
@@ -27,11 +27,15 @@
 
 import os
 import re
-import pybel
-import pandas as pd
+import molstore
+from tableio import formats, readtable, writetable
 from operator import add, itemgetter
 from collections import OrderedDict
 from argparse import ArgumentParser, RawTextHelpFormatter
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+pd = lazyimport('pandas')
 
 ###_* --- Define command-line arguments
 parser = ArgumentParser(description='''
@@ -46,22 +50,25 @@ $ python substructure_molecular_attributes.py --attributes molwt -i example_main
 parser.add_argument('-a','--attributes',type=str,
                     help='comma-separated list of attributes (no spaces)')
 parser.add_argument('-i','--inputfile',type=str,
-                    help='file of SMILES strings (compound, SMILES); csv format')
+                    help='file of SMILES strings (compound, SMILES); csv, parquet or feather format')
 parser.add_argument('-o','--outputfile',type=str,default='output.csv',
-                    help='output file; csv format')
+                    help='output file')
+parser.add_argument('-f','--format',type=str,choices=formats,
+                    help='format of output file (default: from its extension, otherwise csv)')
 
 ## create main class/function
 ## clean = lambda varStr: re.sub('\W|^(?=\d)','_', varStr)
 
 class queryattr:
 
-    def __init__(self,attributes):
+    def __init__(self,attributes,store=None):
         self.attributes = attributes
+        self.store = store if store is not None else molstore.default
 
     def getattributes(self,smilesstr):
         ##
         attributes = self.attributes
-        mol = pybel.readstring('smi',smilesstr)
+        mol = self.store.get(smilesstr,addh=False)
         return pd.Series([getattr(mol,a) for a in attributes], index=attributes)
 
 if __name__=='__main__':
@@ -70,11 +77,11 @@ if __name__=='__main__':
     args = parser.parse_args()
 
 ###_* --- read SMILES strings
-    inp = pd.read_csv(args.inputfile).set_index('compound')
+    inp = readtable(args.inputfile).set_index('compound')
 
 ###_* --- apply search function
     query = queryattr(args.attributes.split(','))
     output = inp.SMILES.apply(query.getattributes)
 
 ###_* --- export output
-    output.to_csv(args.outputfile,index_label='compound')
+    writetable(output,args.outputfile,args.format,index_label='compound')
@@ -26,11 +26,14 @@
 ################################################################################
 
 import os
-import pandas as pd
-import numpy as np
 from collections import OrderedDict
 from argparse import ArgumentParser, RawTextHelpFormatter
-from util import searchgroups
+from util import searchgroups, mapsearch, searchpool, readinput
+from tableio import formats, tablewriter, layouts, matrixwriter
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 ###_* --- Define command-line arguments
 parser = ArgumentParser(description='''
@@ -47,11 +50,25 @@ $ python substructure_search.py --groupfile SMARTSpatterns/FTIRgroups.csv --inpu
 parser.add_argument('-g','--groupfile',type=str,
                     help='file of SMARTS patterns (substructure, pattern, [export]); csv format')
 parser.add_argument('-i','--inputfile',type=str,
-                    help='file of SMILES strings (compound, SMILES); csv format')
+                    help='file of SMILES strings (compound, SMILES); csv, parquet or feather format')
 parser.add_argument('-o','--outputfile',type=str,default='output.csv',
-                    help='output file; csv format')
+                    help='output file')
 parser.add_argument('-e','--export',type=str,
                     help='text file with list of compounds to select in a single column')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes (0 for all cores)')
+parser.add_argument('--cache',type=str,
+                    help='file of cached results (SQLite) to read from and add to')
+parser.add_argument('--cache-size',type=int,default=1000000,
+                    help='maximum number of entries retained in --cache')
+parser.add_argument('-c','--chunksize',type=int,
+                    help='read and write SMILES strings in chunks of this many rows')
+parser.add_argument('-f','--format',type=str,choices=formats,
+                    help='format of OUTPUTFILE (default: from its extension, otherwise csv)')
+parser.add_argument('-s','--sparse',type=str,choices=layouts,
+                    help='write OUTPUTFILE as a sparse matrix (.npz) in this layout')
+parser.add_argument('--profile',type=str,nargs='?',const='',metavar='PROFILEFILE',
+                    help='record time, calls and matches of each pattern; report is printed, or written to PROFILEFILE')
 
 ###_ . Flags (on/off):
 parser.add_argument('-d','--default-directory',action='store_true',help='--groupfile exists in SMARTSpatterns/')
@@ -85,16 +102,49 @@ if __name__=='__main__':
     groups = pd.read_csv(groupfile).drop_duplicates().set_index('substructure')
 
 ###_ . SMILES
-    inp = pd.read_csv(args.inputfile).drop_duplicates().set_index('compound')
+    chunks = readinput(args.inputfile,args.chunksize)
 
-###_* --- Apply search function
+###_* --- Apply search function and export to output
 
     if not export and 'export' in groups.columns:
         export = groups.index[groups['export'].astype('bool')]
 
-    search = searchgroups(groups.pattern, export)
-    output = inp.SMILES.apply(search.count)
+    if args.profile is not None:
+        from profiling import searchprofile
+        profile = searchprofile()
+    else:
+        profile = None
+    search = searchgroups(groups.pattern, export, profile=profile)
+    pool = searchpool(search,args.jobs) if args.jobs != 1 else None
+    if args.cache:
+        from cache import resultcache
+        cache = resultcache(args.cache,args.cache_size)
+        searchfn = cache.mapsearch
+    else:
+        cache = None
+        searchfn = mapsearch
 
-###_* --- Export to output
-    
-    output.to_csv(args.outputfile,index_label='compound')
+    if args.sparse:
+        writer = matrixwriter(args.outputfile,args.sparse)
+    else:
+        writer = tablewriter(args.outputfile,args.format)
+    try:
+        for inp in chunks:
+            output = pd.DataFrame(searchfn(search,'count',inp.SMILES,args.jobs,pool=pool),
+                                  index=inp.index)
+            writer.write(output,index_label='compound')
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.evict()
+            print(cache.stats())
+            cache.close()
+
+    if profile is not None:
+        if args.profile:
+            profile.write(args.profile)
+        else:
+            print(profile.report())
@@ -0,0 +1,618 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## substructure_server.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Long-lived process serving substructure searches, so that programs which
+##   query many small sets of SMILES strings (e.g., models coupled to a
+##   mechanism generator) do not pay for starting python and compiling
+##   patterns with each query. Pattern files are read and compiled once at
+##   startup.
+##
+## Protocol: one JSON object per line in each direction, over a Unix socket
+##   (or a TCP port of 127.0.0.1). Requests are
+##
+##     {"id": ..., "method": ..., "groupfile": ..., "smiles": [...], "temperature": ...}
+##
+##   with method one of
+##     count      - counts of groups (as substructure_search.py)
+##     matchatoms - atoms and matched groups (as the atom table of
+##                  substructure_generate_fulltable.py) and atomic masses
+##     simpol     - SIMPOL.1 vapor pressure (atm) and enthalpy of
+##                  vaporization (kJ/mol) at temperature(s) (K; default 298.15)
+##     groupfiles - names of preloaded group files
+##     metrics    - request counts and latencies
+##     shutdown   - stop the server
+##
+##   and responses {"id": ..., "ok": true, "result": ..., "latency_ms": ...,
+##   "queue_ms": ..., "search_ms": ..., "batch": ...}, or {"id": ..., "ok":
+##   false, "error": ...}. Requests on one connection are answered as they
+##   complete, so that a client may send several before reading responses
+##   (matched by id).
+##
+## Requests for the same search (group file and method) which arrive while a
+##   batch is collected are searched together, with each unique SMILES string
+##   searched once. Searches are run one at a time in a separate thread (the
+##   molecule store and compiled patterns are not shared safely between
+##   threads), or distributed to worker processes with --jobs, while the
+##   event loop continues to accept connections and requests.
+
+import os
+import sys
+import json
+import time
+import socket
+from itertools import chain
+from collections import OrderedDict, deque
+from argparse import ArgumentParser, RawTextHelpFormatter
+from util import searchgroups, patternset, searchpool, mapsearch
+from simpol import SIMPOL1
+from lazyimport import lazyimport
+
+asyncio = lazyimport('asyncio')
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
+
+timer = getattr(time,'perf_counter',time.time)
+
+###_* --- Define command-line arguments
+parser = ArgumentParser(description='''
+============================================================
+Serve substructure searches and SIMPOL.1 estimates from a long-lived process.
+Pattern files are compiled once; clients send batches of SMILES strings as
+JSON lines over a Unix socket. Example usage:
+
+$ python substructure_server.py -d -g MCMgroups.csv FTIRextra.csv -s aprl-ssp.sock
+
+''',formatter_class=RawTextHelpFormatter)
+
+###_ . Arguments
+parser.add_argument('-g','--groupfiles',type=str,nargs='+',default=[],
+                    help='files of SMARTS patterns (substructure, pattern, [export]) to serve; csv format')
+parser.add_argument('-s','--socket',type=str,default='aprl-ssp.sock',
+                    help='path of Unix socket to listen on')
+parser.add_argument('-p','--port',type=int,
+                    help='listen on this TCP port of 127.0.0.1 instead of --socket')
+parser.add_argument('-b','--batchsize',type=int,default=1000,
+                    help='number of SMILES strings at which a batch is searched without waiting further')
+parser.add_argument('-w','--wait',type=float,default=2.,
+                    help='time (ms) a batch waits for further requests after the first')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes for each search (0 for all cores)')
+parser.add_argument('--simpol-groupfile',type=str,
+                    default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'SMARTSpatterns','SIMPOLgroups.csv'),
+                    help='file of SMARTS patterns for SIMPOL groups')
+parser.add_argument('--window',type=int,default=10000,
+                    help='number of most recent requests of each method for latency percentiles')
+
+###_ . Flags (on/off):
+parser.add_argument('-d','--default-directory',action='store_true',help='--groupfiles exist in SMARTSpatterns/')
+
+###_* --- Searches
+
+class preloaded:
+
+    ## compiled patterns of a group file for one method; worker processes
+    ##   (with jobs other than 1) are started on the first batch
+
+    def __init__(self,search,method,jobs=1):
+        self.search = search
+        self.method = method
+        self.jobs = jobs
+        self.pool = None
+
+    def __call__(self,smiles):
+        if self.jobs != 1 and self.pool is None:
+            self.pool = searchpool(self.search,self.jobs)
+        return mapsearch(self.search,self.method,smiles,self.jobs,pool=self.pool)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+def readgroups(groupfile):
+    return pd.read_csv(groupfile).drop_duplicates().set_index('substructure')
+
+def loadsearches(groupfiles,ddirectory,simpolfile,jobs=1):
+    ## searches keyed by (name, method): counts of exported groups (as
+    ##   substructure_search.py) and matched atoms of exported groups (as
+    ##   substructure_generate_fulltable.py) for each group file, and counts
+    ##   of SIMPOL groups. Patterns of a group file are compiled once for
+    ##   both methods.
+    searches = OrderedDict()
+    for groupfile in groupfiles:
+        groups = readgroups(os.path.join(ddirectory,groupfile))
+        compiled = patternset(groups.pattern)
+        if 'export' in groups.columns:
+            export = groups.index[groups['export'].astype('bool')]
+            flags = groups['export']
+        else:
+            export = None
+            flags = pd.Series(1,index=groups.index)
+        name = os.path.basename(groupfile)
+        searches[(name,'count')] = preloaded(searchgroups(compiled,export),'count',jobs)
+        searches[(name,'matchatoms')] = preloaded(searchgroups(compiled,flags),'matchatoms',jobs)
+    simp = SIMPOL1()
+    search = searchgroups(readgroups(simpolfile).pattern,simp.get_groupnames().tolist())
+    searches[('SIMPOL','count')] = preloaded(search,'count',jobs)
+    return searches, simp
+
+###_* --- Results
+
+def _integers(values):
+    return [None if x != x else int(x) for x in np.asarray(values,dtype=float).tolist()]
+
+def _labels(values):
+    return [None if x is None or x != x else str(x) for x in values]
+
+def counttable(counts):
+    ## counts (Series of each SMILES string) as columns and rows of integers
+    if not counts:
+        return OrderedDict([('columns',[]),('counts',[])])
+    return OrderedDict([('columns',[str(x) for x in counts[0].index]),
+                        ('counts',[_integers(x.values) for x in counts])])
+
+def atomtable(matched):
+    ## atom table and (atomtype, atomicmass) of one SMILES string
+    indextable, masses = matched
+    return OrderedDict([('atom',_integers(indextable['atom'])),
+                        ('type',_labels(indextable['type'])),
+                        ('match',_integers(indextable['match'])),
+                        ('group',_labels(indextable['group'])),
+                        ('atomicmass',[[t,m] for t, m in sorted(masses)])])
+
+def simpoltable(simp,counts,temperature):
+    ## vapor pressure and enthalpy of vaporization of each SMILES string;
+    ##   lists of temperatures give a list (of temperatures) for each
+    nuk = np.array([x.values for x in counts],dtype=int).reshape(len(counts),-1)
+    p0, deltaH = simp.properties(nuk,temperature)
+    return OrderedDict([('temperature',np.asarray(temperature,dtype=float).tolist()),
+                        ('p0',p0.tolist()),
+                        ('DeltaH',deltaH.tolist())])
+
+###_* --- Metrics
+
+def _summary(values):
+    ## mean and percentiles (ms) of durations (s)
+    if not values:
+        return OrderedDict()
+    values = 1e3*np.asarray(values)
+    return OrderedDict([('mean',float(values.mean()))]+
+                       [(k,float(np.percentile(values,q))) for k, q in [('p50',50),('p95',95),('p99',99)]]+
+                       [('max',float(values.max()))])
+
+class latencies:
+
+    ## numbers of requests, SMILES strings and errors of each method, and
+    ##   latencies of the most recent requests: total (from receipt to
+    ##   response), queued (waiting for a batch to be searched) and searched
+    ##   (search of the batch)
+
+    def __init__(self,window=10000):
+        self.window = window
+        self.started = time.time()
+        self.methods = OrderedDict()
+        self.batches = OrderedDict([('batches',0),('requests',0),('smiles',0),('unique',0)])
+        self.clients = OrderedDict([('connected',0),('total',0)])
+
+    def add(self,method,nsmiles,total,queued=None,searched=None,ok=True):
+        record = self.methods.get(method)
+        if record is None:
+            record = self.methods[method] = OrderedDict([
+                ('requests',0),('smiles',0),('errors',0),
+                ('total',deque(maxlen=self.window)),
+                ('queued',deque(maxlen=self.window)),
+                ('searched',deque(maxlen=self.window))])
+        record['requests'] += 1
+        record['smiles'] += nsmiles
+        record['errors'] += not ok
+        record['total'].append(total)
+        if queued is not None:
+            record['queued'].append(queued)
+            record['searched'].append(searched)
+
+    def addbatch(self,nrequests,nsmiles,nunique):
+        self.batches['batches'] += 1
+        self.batches['requests'] += nrequests
+        self.batches['smiles'] += nsmiles
+        self.batches['unique'] += nunique
+
+    def summary(self):
+        methods = OrderedDict()
+        for method, record in self.methods.items():
+            methods[method] = OrderedDict(
+                [(k,record[k]) for k in ['requests','smiles','errors']]+
+                [(k+'_ms',_summary(list(record[k]))) for k in ['total','queued','searched']])
+        nbatches = max(self.batches['batches'],1)
+        return OrderedDict([
+            ('uptime_s',time.time()-self.started),
+            ('clients',self.clients),
+            ('batches',OrderedDict([('batches',self.batches['batches'])]+
+                                   [('mean_'+k,self.batches[k]/float(nbatches)) for k in ['requests','smiles','unique']])),
+            ('methods',methods)])
+
+    def report(self):
+        rows = []
+        for method, record in self.summary()['methods'].items():
+            total = record['total_ms']
+            rows.append([method,record['requests'],record['smiles'],record['errors']]+
+                        [total.get(k,np.nan) for k in ['mean','p50','p95','p99','max']])
+        table = pd.DataFrame(rows,columns=['method','requests','smiles','errors','mean ms','p50 ms','p95 ms','p99 ms','max ms'])
+        return table.to_string(index=False,float_format=lambda x: '{:.4g}'.format(x))
+
+###_* --- Batching
+
+class pending:
+
+    ## request waiting in a batch; future is set to (results of each SMILES
+    ##   string, time queued, time searched, number of requests in batch)
+
+    def __init__(self,smiles,future):
+        self.smiles = smiles
+        self.future = future
+        self.received = timer()
+
+class batcher:
+
+    ## requests for one search are queued and searched together: a batch
+    ##   starts with the first request in the queue and collects further
+    ##   requests for up to wait seconds, or until it holds batchsize SMILES
+    ##   strings. A batch which fails is retried one request at a time, so
+    ##   that only the requests with errors (e.g., SMILES strings which are
+    ##   not parsed) fail.
+
+    def __init__(self,search,executor,metrics,batchsize=1000,wait=0.002):
+        self.search = search
+        self.executor = executor
+        self.metrics = metrics
+        self.batchsize = batchsize
+        self.wait = wait
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self.run())
+
+    def submit(self,smiles):
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait(pending(smiles,future))
+        return future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            nsmiles = len(batch[0].smiles)
+            deadline = loop.time()+self.wait
+            while nsmiles < self.batchsize:
+                timeout = deadline-loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(),timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                nsmiles += len(item.smiles)
+            await self.process(batch)
+
+    async def process(self,batch):
+        loop = asyncio.get_event_loop()
+        smiles = list(OrderedDict.fromkeys(chain.from_iterable(x.smiles for x in batch)))
+        start = timer()
+        try:
+            results = await loop.run_in_executor(self.executor,self.search,smiles)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self.process([item])
+            elif not batch[0].future.done():
+                batch[0].future.set_exception(e)
+            return
+        searched = timer()-start
+        self.metrics.addbatch(len(batch),sum(len(x.smiles) for x in batch),len(smiles))
+        results = dict(zip(smiles,results))
+        for item in batch:
+            if not item.future.done(): # cancelled if the client disconnected
+                item.future.set_result(([results[x] for x in item.smiles],
+                                        start-item.received,searched,len(batch)))
+
+    def cancel(self):
+        self.task.cancel()
+
+###_* --- Server
+
+class searchserver:
+
+    def __init__(self,searches,simp,batchsize=1000,wait=0.002,window=10000):
+        from concurrent.futures import ThreadPoolExecutor
+        self.searches = searches
+        self.simp = simp
+        self.metrics = latencies(window)
+        self.executor = ThreadPoolExecutor(1)
+        self.batchers = OrderedDict(
+            (key, batcher(search,self.executor,self.metrics,batchsize,wait))
+            for key, search in searches.items())
+        self.groupfiles = [name for name, method in searches if name!='SIMPOL' and method=='count']
+        self.connections = OrderedDict() # handler task -> reader
+        self.stopped = asyncio.Event()
+
+    def groupfile(self,request):
+        ## name of a preloaded group file, with or without directory or
+        ##   extension
+        name = request.get('groupfile')
+        if name is None:
+            raise ValueError('request has no groupfile')
+        name = os.path.basename(name)
+        for x in self.groupfiles:
+            if name in (x,os.path.splitext(x)[0]):
+                return x
+        raise KeyError('groupfile {} is not loaded'.format(name))
+
+    @staticmethod
+    def smiles(request):
+        smiles = request.get('smiles',[])
+        return [smiles] if isinstance(smiles,str) else [str(x) for x in smiles]
+
+    async def search(self,key,smiles):
+        if not smiles:
+            return [], 0., 0., 0
+        return await self.batchers[key].submit(smiles)
+
+    async def dispatch(self,request):
+        ## result of request and (SMILES strings, time queued, time
+        ##   searched, requests in batch)
+        method = request.get('method')
+        if method in ('count','matchatoms'):
+            smiles = self.smiles(request)
+            results, queued, searched, nbatch = await self.search((self.groupfile(request),method),smiles)
+            result = counttable(results) if method=='count' else [atomtable(x) for x in results]
+        elif method=='simpol':
+            smiles = self.smiles(request)
+            results, queued, searched, nbatch = await self.search(('SIMPOL','count'),smiles)
+            result = simpoltable(self.simp,results,request.get('temperature',298.15))
+        elif method=='groupfiles':
+            return self.groupfiles, None
+        elif method=='metrics':
+            return self.metrics.summary(), None
+        elif method=='shutdown':
+            self.stopped.set()
+            return True, None
+        else:
+            raise ValueError('unknown method {}'.format(method))
+        return result, (len(smiles),queued,searched,nbatch)
+
+    async def respond(self,line,writer,lock):
+        received = timer()
+        request, timing = {}, None
+        try:
+            parsed = json.loads(line.decode('utf-8'))
+            if not isinstance(parsed,dict):
+                raise ValueError('request is not a JSON object')
+            request = parsed
+            result, timing = await self.dispatch(request)
+            response = OrderedDict([('id',request.get('id')),('ok',True),('result',result)])
+        except Exception as e:
+            response = OrderedDict([('id',request.get('id')),('ok',False),
+                                    ('error','{}: {}'.format(type(e).__name__,e))])
+        total = timer()-received
+        response['latency_ms'] = 1e3*total
+        if timing is not None:
+            nsmiles, queued, searched, nbatch = timing
+            response['queue_ms'] = 1e3*queued
+            response['search_ms'] = 1e3*searched
+            response['batch'] = nbatch
+            self.metrics.add(request['method'],nsmiles,total,queued,searched)
+        elif not response['ok']:
+            self.metrics.add(str(request.get('method')),0,total,ok=False)
+        writer.write((json.dumps(response)+'\n').encode('utf-8'))
+        async with lock: # concurrent drain() is not supported by older versions of asyncio
+            await writer.drain()
+
+    async def handle(self,reader,writer):
+        ## one coroutine per connection; each request is answered by its
+        ##   own task
+        self.metrics.clients['connected'] += 1
+        self.metrics.clients['total'] += 1
+        self.connections[asyncio.current_task()] = reader
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self.respond(line,writer,lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(list(tasks))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            ## client disconnected, or sent a line longer than the limit
+            for task in tasks:
+                task.cancel()
+        finally:
+            self.metrics.clients['connected'] -= 1
+            self.connections.pop(asyncio.current_task(),None)
+            writer.close()
+
+    async def drain(self):
+        ## stop reading requests; requests already received are answered
+        ##   before connections are closed
+        for reader in self.connections.values():
+            reader.feed_eof()
+        if self.connections:
+            await asyncio.wait(list(self.connections))
+
+    def close(self):
+        for x in self.batchers.values():
+            x.cancel()
+        self.executor.shutdown()
+        for x in self.searches.values():
+            x.close()
+
+## maximum length of a request (bytes)
+linelimit = 2**28
+
+async def serve(searches,simp,path=None,port=None,batchsize=1000,wait=0.002,window=10000):
+    ## serve until stopped (shutdown request, SIGINT or SIGTERM); returns
+    ##   the metrics of the server
+    import signal
+    server = searchserver(searches,simp,batchsize,wait,window)
+    if port is not None:
+        listener = await asyncio.start_server(server.handle,'127.0.0.1',port,limit=linelimit)
+        address = '127.0.0.1:{:d}'.format(port)
+    else:
+        if os.path.exists(path):
+            os.remove(path) # left by a server which was not stopped
+        listener = await asyncio.start_unix_server(server.handle,path,limit=linelimit)
+        address = path
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT,signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig,server.stopped.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    print('serving {} on {}'.format(', '.join(server.groupfiles+['SIMPOL']),address))
+    sys.stdout.flush()
+    try:
+        await server.stopped.wait()
+        listener.close()
+        await server.drain()
+    finally:
+        listener.close()
+        server.close()
+        if port is None and os.path.exists(path):
+            os.remove(path)
+    return server.metrics
+
+###_* --- Client
+
+class servererror(Exception):
+    pass
+
+class searchclient:
+
+    ## blocking client for one connection:
+    ##
+    ##   client = searchclient('aprl-ssp.sock') # or a port of 127.0.0.1
+    ##   counts = client.count(['CC(=O)O','OCCO'],'MCMgroups.csv')
+    ##
+    ##   count and simpol return DataFrames indexed by SMILES string (or
+    ##   compound, if given); matchatoms returns the atom table and atomic
+    ##   masses of each SMILES string. Unlike responses, the latencies of
+    ##   the last request are kept in self.last.
+
+    def __init__(self,address='aprl-ssp.sock'):
+        if isinstance(address,int):
+            self.sock = socket.create_connection(('127.0.0.1',address))
+        else:
+            self.sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.file = self.sock.makefile('rwb')
+        self.nextid = 0
+        self.last = None
+
+    def request(self,method,**kwargs):
+        self.nextid += 1
+        request = OrderedDict([('id',self.nextid),('method',method)])
+        request.update(kwargs)
+        self.file.write((json.dumps(request)+'\n').encode('utf-8'))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise servererror('connection closed by server')
+        response = json.loads(line.decode('utf-8'))
+        if not response['ok']:
+            raise servererror(response['error'])
+        self.last = OrderedDict((k,v) for k, v in response.items() if k not in ('id','ok','result'))
+        return response['result']
+
+    def count(self,smiles,groupfile,index=None):
+        smiles = list(smiles)
+        result = self.request('count',groupfile=groupfile,smiles=smiles)
+        return pd.DataFrame(result['counts'],columns=result['columns'],
+                            index=pd.Index(smiles if index is None else index,name='compound'))
+
+    def matchatoms(self,smiles,groupfile):
+        ## list of (atom table, [(atomtype, atomicmass)]) for each SMILES string
+        result = self.request('matchatoms',groupfile=groupfile,smiles=list(smiles))
+        return [(pd.DataFrame(OrderedDict((k,x[k]) for k in ['atom','type','match','group'])),
+                 [tuple(m) for m in x['atomicmass']]) for x in result]
+
+    def simpol(self,smiles,temperature=298.15,index=None):
+        smiles = list(smiles)
+        if np.ndim(temperature) > 0:
+            temperature = [float(x) for x in temperature]
+        result = self.request('simpol',smiles=smiles,temperature=temperature)
+        index = pd.Index(smiles if index is None else index,name='compound')
+        if np.ndim(temperature) == 0:
+            return pd.DataFrame(OrderedDict([('p0',result['p0']),('DeltaH',result['DeltaH'])]),index=index)
+        columns = pd.Index(result['temperature'],name='temperature')
+        return pd.concat(OrderedDict([
+            ('p0',pd.DataFrame(result['p0'],index=index,columns=columns)),
+            ('DeltaH',pd.DataFrame(result['DeltaH'],index=index,columns=columns))
+            ]),axis=1,names=['property'])
+
+    def groupfiles(self):
+        return self.request('groupfiles')
+
+    def metrics(self):
+        return self.request('metrics')
+
+    def shutdown(self):
+        return self.request('shutdown')
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+if __name__=='__main__':
+
+###_* --- Parse arguments
+
+    args = parser.parse_args()
+
+    ## pattern directory
+    if args.default_directory:
+        ddirectory = os.path.join(os.path.dirname(__file__),'SMARTSpatterns')
+    else:
+        ddirectory = ''
+
+###_* --- Read and compile patterns
+
+    searches, simp = loadsearches(args.groupfiles,ddirectory,args.simpol_groupfile,args.jobs)
+
+###_* --- Serve requests
+
+    metrics = asyncio.run(serve(searches,simp,args.socket,args.port,
+                                args.batchsize,args.wait/1e3,args.window))
+    print(metrics.report())
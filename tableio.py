@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## tableio.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Tables in csv, parquet or feather (Arrow IPC) format. Parquet and feather
+##   files are written with integer and categorical (compound, atom type,
+##   group) columns so that no formatting pass is needed for writing and no
+##   parsing for reading; pyarrow is required only for these formats. The
+##   index of a table is written as its first column in all formats.
+
+import os
+from lazyimport import lazyimport
+
+np = lazyimport('numpy')
+pd = lazyimport('pandas')
+
+formats = ['csv','parquet','feather']
+extensions = {'csv':'.csv','parquet':'.parquet','feather':'.feather'}
+
+## columns stored as categorical in parquet and feather files
+categorical = ['compound','type','group','atomtype','atom1_type','atom2_type','ctype']
+
+def tableformat(filename,fmt=None):
+    ## fmt if given, otherwise format from file extension (csv by default)
+    if fmt:
+        return fmt
+    ext = os.path.splitext(filename)[1].lower()
+    for k, v in extensions.items():
+        if ext==v:
+            return k
+    return 'feather' if ext in ['.arrow','.ipc'] else 'csv'
+
+def categorize(df):
+    for var in categorical:
+        if var in df.columns and df[var].dtype==object:
+            df[var] = df[var].astype('category')
+    return df
+
+def readtable(filename,**kwargs):
+    ## read table written in any format; categories of categorical columns
+    ##   are sorted (as values read from csv files would be when grouped)
+    fmt = tableformat(filename)
+    if fmt=='csv':
+        return pd.read_csv(filename,**kwargs)
+    if fmt=='parquet':
+        df = pd.read_parquet(filename)
+    else:
+        df = pd.read_feather(filename)
+    for var in df.columns:
+        if hasattr(df[var],'cat'):
+            df[var] = df[var].cat.set_categories(sorted(df[var].cat.categories))
+    return df
+
+def arrowtable(df,index_label=None):
+    ## Arrow table with index (if index_label) as first column; categorical
+    ##   columns are dictionary-encoded with 32-bit indices so that tables of
+    ##   different chunks have the same schema
+    import pyarrow as pa
+    if index_label is not None:
+        df = df.rename_axis(index_label).reset_index()
+    df = categorize(df.copy())
+    table = pa.Table.from_pandas(df,preserve_index=False)
+    fields = [pa.field(f.name,pa.dictionary(pa.int32(),f.type.value_type))
+              if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields,metadata=table.schema.metadata))
+
+class tablewriter:
+
+    ## writes a table one chunk (DataFrame with the same columns) at a time.
+    ##   csv files are appended to, parquet files are written with one row
+    ##   group per chunk, and feather files (which cannot be appended to)
+    ##   are written when closed. Keyword arguments of write() are passed to
+    ##   DataFrame.to_csv for csv files.
+
+    def __init__(self,filename,fmt=None):
+        self.filename = filename
+        self.fmt = tableformat(filename,fmt)
+        self.nchunks = 0
+        self.writer = None
+        self.tables = []
+
+    def write(self,df,index_label=None,**kwargs):
+        ## index_label: name of index column; index is not written if None
+        if self.fmt=='csv':
+            df.to_csv(self.filename,index=index_label is not None,index_label=index_label,
+                      mode='w' if self.nchunks==0 else 'a',header=self.nchunks==0,**kwargs)
+        else:
+            table = arrowtable(df,index_label)
+            if self.fmt=='parquet':
+                import pyarrow.parquet as pq
+                if self.writer is None:
+                    self.writer = pq.ParquetWriter(self.filename,table.schema)
+                self.writer.write_table(table.cast(self.writer.schema))
+            else:
+                self.tables.append(table)
+        self.nchunks += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.tables:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+            schema = self.tables[0].schema
+            table = pa.concat_tables([x.cast(schema) for x in self.tables]).unify_dictionaries()
+            feather.write_feather(table.combine_chunks(),self.filename)
+            self.tables = []
+
+def writetable(df,filename,fmt=None,index_label=None,**kwargs):
+    ## write a whole table (see tablewriter)
+    writer = tablewriter(filename,fmt)
+    writer.write(df,index_label,**kwargs)
+    writer.close()
+
+## compound x group (and similar) matrices may be written as scipy.sparse
+##   matrices in .npz files (scipy.sparse.save_npz), with row and column
+##   labels in {stem}_rows.csv and {stem}_columns.csv. Counts are summed
+##   directly from records so that the dense table is not formed; scipy is
+##   required only for these files.
+
+layouts = ['csr','coo']
+matrixextension = '.npz'
+
+def labelfiles(filename):
+    stem = os.path.splitext(filename)[0]
+    return stem+'_rows.csv', stem+'_columns.csv'
+
+def countmatrix(rowvalues,colvalues,rows,columns,data=None):
+    ## CSR matrix of len(rows) x len(columns) with data (default 1) summed
+    ##   over records (rowvalues[i], colvalues[i]); values must be in rows
+    ##   and columns, respectively
+    from scipy import sparse
+    i = pd.Index(rows).get_indexer(rowvalues)
+    j = pd.Index(columns).get_indexer(colvalues)
+    if data is None:
+        data = np.ones(len(i),dtype=np.int32)
+    return sparse.coo_matrix((data,(i,j)),shape=(len(rows),len(columns))).tocsr()
+
+def writematrix(matrix,rows,columns,filename,layout='csr'):
+    ## matrix is written to {stem}.npz for filename {stem}.*; rows and
+    ##   columns are written with their names (Index.name) as header
+    from scipy import sparse
+    filename = os.path.splitext(filename)[0]+matrixextension
+    matrix = matrix.tocsr() if layout=='csr' else matrix.tocoo()
+    sparse.save_npz(filename,matrix,compressed=True)
+    for labels, labelfile in zip([rows,columns],labelfiles(filename)):
+        labels = pd.Index(labels)
+        labels.to_frame(index=False,name=labels.name or 'label').to_csv(labelfile,index=False)
+
+def readmatrix(filename):
+    ## returns (matrix, rows, columns); rows and columns are Index objects
+    from scipy import sparse
+    matrix = sparse.load_npz(filename)
+    labels = [pd.read_csv(f,dtype=str,keep_default_na=False).iloc[:,0] for f in labelfiles(filename)]
+    return tuple([matrix]+[pd.Index(x.values,name=x.name) for x in labels])
+
+class matrixwriter:
+
+    ## writes a table one chunk (DataFrame with the same columns) at a time
+    ##   as a sparse matrix (see writematrix); chunks are converted to CSR
+    ##   blocks as they are written and stacked when closed.
+
+    def __init__(self,filename,layout='csr'):
+        self.filename = filename
+        self.layout = layout
+        self.blocks = []
+        self.rows = []
+        self.columns = None
+
+    def write(self,df,index_label=None):
+        from scipy import sparse
+        if self.columns is None:
+            self.columns = df.columns
+        self.blocks.append(sparse.csr_matrix(df.reindex(columns=self.columns).values))
+        self.rows.append(df.index.rename(index_label or df.index.name))
+
+    def close(self):
+        from scipy import sparse
+        if self.columns is None:
+            return
+        rows = self.rows[0].append(self.rows[1:]) if len(self.rows) > 1 else self.rows[0]
+        writematrix(sparse.vstack(self.blocks,format='csr'),rows,self.columns,
+                    self.filename,self.layout)
+        self.blocks = []
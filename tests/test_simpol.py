@@ -0,0 +1,66 @@
+################################################################################
+##
+## test_simpol.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+## Temperature grids of simpol.py (-t and -r). Run from the top directory:
+##   $ python -m pytest tests
+
+import os
+import sys
+import subprocess
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+
+import numpy as np
+import pytest
+from simpol import temperatures
+
+def test_temperatures_list():
+    assert np.array_equal(temperatures([298.15,310.]),[298.15,310.])
+
+def test_temperatures_range_multiple():
+    ## STOP on the grid is included
+    assert np.allclose(temperatures(None,(240.,320.,5.)),np.arange(240,321,5))
+
+def test_temperatures_range_not_multiple():
+    ## spacing is exactly STEP; the grid stops below STOP
+    temps = temperatures(None,(240.,320.,15.))
+    assert np.allclose(temps,[240,255,270,285,300,315])
+    assert np.allclose(np.diff(temps),15.)
+
+def test_temperatures_range_single():
+    assert np.allclose(temperatures(None,(298.15,298.15,1.)),[298.15])
+
+@pytest.mark.parametrize('temprange',[(240.,320.,0.),(240.,320.,-5.),(320.,240.,5.)])
+def test_temperatures_range_invalid(temprange):
+    with pytest.raises(ValueError):
+        temperatures(None,temprange)
+
+@pytest.mark.parametrize('temprange',[['240','320','0'],['320','240','5']])
+def test_temprange_rejected_by_parser(temprange):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'simpol.py')
+    proc = subprocess.run([sys.executable,script,'-i','unused.csv','-r']+temprange,
+                          stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+    assert proc.returncode == 2
+    assert 'STEP > 0' in proc.stderr
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## update_carbontypes.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from util import searchgroups, searchpool, readinput
+from substructure_generate_fulltable import matchtable, formatatoms
+from generate_carbontypes import carbonatoms, carbontypes, label_ctype, xmatrix, ymatrix, gammatable
+from tableio import formats, extensions, readtable, tablewriter, writetable
+from atomindex import readatomtable
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
+
+## -----------------------------------------------------------------------------
+
+## Define command-line arguments
+
+parser = ArgumentParser(description='''
+============================================================
+Update the atom table (substructure_generate_fulltable.py) and carbon type
+matrices (generate_carbontypes.py) of a mechanism with new or changed
+compounds. Only the compounds in the delta file are matched; they replace
+compounds of the same name. Outputs are the same as those obtained by running
+both scripts on the updated mechanism. Example usage:
+
+$ python update_carbontypes.py -d -g MCMgroups.csv -i apinene_delta.csv -a apinene_MCMgroups_atomfulltable.csv -p apinene -o apinene_updated
+
+''',formatter_class=RawTextHelpFormatter)
+
+## Arguments
+
+parser.add_argument('-g','--groupfile',type=str,
+                    help='file of SMARTS patterns (substructure, pattern) used for ATOMFULLTABLE; csv format')
+parser.add_argument('-i','--inputfile',type=str,
+                    help='file of new or changed SMILES strings (compound, SMILES); csv, parquet or feather format')
+parser.add_argument('-a','--atomfulltable',type=str,
+                    help='existing file generated by substructure_generate_fulltable.py; csv, parquet, feather or atom index (.bin) format')
+parser.add_argument('-p','--prefix',type=str,
+                    help='output prefix of existing files generated by generate_carbontypes.py')
+parser.add_argument('-o','--outputprefix',type=str,default='output',
+                    help='output prefix of updated files ({prefix}_atomfulltable, {prefix}_carbontypes_*)')
+parser.add_argument('-f','--format',type=str,choices=formats,default='csv',
+                    help='format of output files')
+parser.add_argument('-j','--jobs',type=int,default=1,
+                    help='number of worker processes (0 for all cores)')
+parser.add_argument('--cache',type=str,
+                    help='file of cached results (SQLite) to read from and add to')
+parser.add_argument('--cache-size',type=int,default=1000000,
+                    help='maximum number of entries retained in --cache')
+
+## Flags (on/off):
+parser.add_argument('-d','--default-directory',action='store_true',
+                    help='--groupfile exists in SMARTSpatterns/')
+
+## -----------------------------------------------------------------------------
+
+def readoutput(prefix,name):
+    ## existing output of generate_carbontypes.py, in any format
+    for ext in extensions.values():
+        filename = '{}_carbontypes_{}{}'.format(prefix,name,ext)
+        if os.path.exists(filename):
+            table = readtable(filename)
+            return table.set_index(table.columns[0])
+    sys.exit('USER ERROR: {}_carbontypes_{} not found'.format(prefix,name))
+
+def mergerows(old,new,removed):
+    ## rows of old for compounds not in removed, and rows of new; columns
+    ##   without nonzero entries are dropped
+    merged = pd.concat([old.loc[~old.index.isin(removed)],new]).fillna(0).astype(np.int64)
+    merged = merged.loc[:,(merged!=0).any()]
+    return merged.sort_index().sort_index(axis=1)
+
+def mergetypes(ymat,theta,wf,removed):
+    ## Y and carbon types of the updated mechanism. Types of remaining
+    ##   compounds are taken from Theta; their labels change if groups are
+    ##   added to or removed from the carbon atoms of the mechanism. wf is
+    ##   the table of group counts of carbon atoms of the new compounds.
+    kept = ymat.loc[~ymat.index.isin(removed)]
+    used = kept.columns[(kept!=0).any()]
+    vectors = theta.loc[used]
+    fgvars = pd.Index(sorted(set(vectors.columns[(vectors!=0).any()]) | set(wf.columns)),name='group')
+    vectors = vectors.reindex(columns=fgvars,fill_value=0)
+    vectors.index = [label_ctype(x) for x in vectors.values]
+    kept = kept[used].set_axis(vectors.index,axis=1)
+    if len(wf):
+        wf = wf.reindex(columns=fgvars,fill_value=0)
+        wf['ctype'], newtypes = carbontypes(wf)
+        ymat = mergerows(kept,ymatrix(wf),[])
+        vectors = pd.concat([vectors,newtypes])
+    else:
+        ymat = mergerows(kept,kept.iloc[:0],[])
+    vectors = vectors.loc[~vectors.index.duplicated()]
+    vectors.columns = fgvars
+    return ymat, vectors
+
+def ordertypes(ymat,vectors,fulltable):
+    ## Theta, with types in order of first appearance among carbon atoms
+    ##   sorted by (compound, atom): the first compound of each type is found
+    ##   from Y, and atoms are examined only for these compounds
+    firstrow = pd.Series((ymat.values!=0).argmax(axis=0),index=ymat.columns)
+    firstcompound = pd.Series(ymat.index[firstrow.values],index=ymat.columns)
+    wf = carbonatoms(fulltable.loc[fulltable['compound'].isin(firstcompound.unique())])
+    wf = wf.reindex(columns=vectors.columns,fill_value=0)
+    atoms = pd.DataFrame({
+        'compound':wf.index.get_level_values('compound').astype(str),
+        'atom':wf.index.get_level_values('atom'),
+        'ctype':carbontypes(wf)[0],
+        })
+    atoms = atoms.loc[atoms['compound'].values==firstcompound.reindex(atoms['ctype']).astype(str).values]
+    first = pd.DataFrame({'row':firstrow,'atom':atoms.groupby('ctype')['atom'].min()})
+    theta = vectors.loc[first.sort_values(['row','atom']).index]
+    theta.index.name = 'ctype'
+    return theta
+
+## -----------------------------------------------------------------------------
+
+if __name__=='__main__':
+
+    ## parse arguments
+
+    args = parser.parse_args()
+
+    if args.default_directory:
+        ddirectory = os.path.join(os.path.dirname(__file__),'SMARTSpatterns')
+    else:
+        ddirectory = ''
+
+    ## -------------------------------------------------------------------------
+
+    ## read existing outputs
+
+    fulltable = readatomtable(args.atomfulltable)
+    xmat = readoutput(args.prefix,'X')
+    ymat = readoutput(args.prefix,'Y')
+    theta = readoutput(args.prefix,'Theta')
+
+    ## -------------------------------------------------------------------------
+
+    ## match new compounds
+
+    groups = pd.read_csv(os.path.join(ddirectory,args.groupfile)).drop_duplicates().set_index('substructure')
+    if 'export' not in groups.columns:
+        groups['export'] = 1
+    search = searchgroups(groups.pattern,groups.export)
+
+    inp = next(readinput(args.inputfile))
+    pool = searchpool(search,args.jobs) if args.jobs != 1 else None
+    if args.cache:
+        from cache import resultcache
+        cache = resultcache(args.cache,args.cache_size)
+    else:
+        cache = None
+    try:
+        delta, _ = matchtable(search,inp,args.jobs,pool,cache)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.evict()
+            print(cache.stats())
+            cache.close()
+
+    removed = inp.index
+    fulltable = pd.concat([fulltable.loc[~fulltable['compound'].isin(removed)],delta],ignore_index=True)
+
+    ## -------------------------------------------------------------------------
+
+    ## merge
+
+    xmat = mergerows(xmat,xmatrix(delta),removed)
+    ymat, vectors = mergetypes(ymat,theta,carbonatoms(delta),removed)
+    theta = ordertypes(ymat,vectors,fulltable)
+    gamma = gammatable(fulltable,xmat.columns)
+
+    ## -------------------------------------------------------------------------
+
+    ## export
+
+    extension = extensions[args.format]
+    outputfile = '{}_carbontypes_{}'+extension
+    writetable(xmat,outputfile.format(args.outputprefix,'X'),args.format,'compound')
+    writetable(ymat,outputfile.format(args.outputprefix,'Y'),args.format,'compound')
+    writetable(theta,outputfile.format(args.outputprefix,'Theta'),args.format,'ctype')
+    writetable(gamma,outputfile.format(args.outputprefix,'gamma'),args.format,'group')
+
+    writer = tablewriter('{}_atomfulltable{}'.format(args.outputprefix,extension),args.format)
+    writer.write(formatatoms(fulltable,writer.fmt))
+    writer.close()
@@ -25,8 +25,47 @@
 ##
 ################################################################################
 
-import pybel
-from itertools import chain
+from collections import defaultdict
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+
+## compiled SMARTS patterns, by pattern string
+_smarts = {}
+
+def smarts(pattern):
+    if pattern not in _smarts:
+        _smarts[pattern] = pybel.Smarts(pattern)
+    return _smarts[pattern]
+
+class ringindex:
+
+    ## atoms of each ring in the SSSR and rings containing each atom; built
+    ##   once per molecule and shared by the functions below
+
+    def __init__(self,mol):
+        atoms = [a.idx for a in mol.atoms]
+        self.rings = []                  # atom indices of each ring
+        self.aromatic = []               # aromaticity of each ring
+        self.atomrings = defaultdict(set) # positions of rings containing each atom
+        for i, ring in enumerate(mol.sssr):
+            members = tuple(idx for idx in atoms if ring.IsInRing(idx))
+            self.rings.append(members)
+            self.aromatic.append(ring.IsAromatic())
+            for idx in members:
+                self.atomrings[idx].add(i)
+
+    def ringsof(self,group):
+        ## positions of rings containing any atom in group
+        return set().union(*[self.atomrings[idx] for idx in group if idx in self.atomrings])
+
+def ring_index(mol):
+    ## ring index stored with the molecule so that SSSR is only traversed once
+    ##   for all groups evaluated on it
+    index = getattr(mol,'_ringindex',None)
+    if index is None:
+        index = mol._ringindex = ringindex(mol)
+    return index
 
 def count_aromatic_rings(mol):
     return len(atoms_aromatic_rings(mol))
@@ -39,42 +78,24 @@ def count_nitrophenols(mol, phenol, nitro):
     return len(atoms_nitrophenols(mol, phenol, nitro))
 
 def atoms_aromatic_rings(mol):
-    return set([tuple(a.idx for a in mol.atoms if ring.IsInRing(a.idx))
-                for ring in mol.sssr if ring.IsAromatic()])
+    index = ring_index(mol)
+    return set([ring for ring, arom in zip(index.rings,index.aromatic) if arom])
 
 def atoms_nonaromatic_rings(mol):
-    return set([tuple(a.idx for a in mol.atoms if ring.IsInRing(a.idx))
-                for ring in mol.sssr if not ring.IsAromatic()])
+    index = ring_index(mol)
+    return set([ring for ring, arom in zip(index.rings,index.aromatic) if not arom])
 
 def atoms_nitrophenols(mol, phenol, nitro):
-    ## returns phenols for which nitro groups are found in same ring
-    def is_part_of_ring(ring, group):
-        ring_atoms = atom_indices_ring(r, mol) #not the most efficient
-        return len([idx for idx in group if idx in ring_atoms]) > 0
-    def atom_indices_ring(ring,mol):
-        return [a.idx for a in mol.atoms if ring.IsInRing(a.idx)]
-    def atom_indices_group(groups):
-        return list(chain.from_iterable(groups))
-    _phenol = pybel.Smarts(phenol).findall(mol)
-    _nitro = pybel.Smarts(nitro).findall(mol)
-    _rings = [ring for ring in mol.sssr if ring.IsAromatic()]
-    atomlist_ring = []        # list of rings
+    ## returns phenols for which nitro groups are found in same (aromatic) ring
+    index = ring_index(mol)
+    _phenol = smarts(phenol).findall(mol)
+    _nitro = smarts(nitro).findall(mol)
+    phenolrings = [index.ringsof(x) for x in _phenol]
+    nitrorings = set().union(*[index.ringsof(y) for y in _nitro])
     atomlist_nitrophenol = [] # list of (nitro)phenol groups
-    for r in _rings:
-        part = {'phenol':[],'nitro':[]}
-        for x in _phenol:
-            if not is_part_of_ring(r, x):
-                continue
-            part['phenol'].append(x)
-            for y in _nitro:
-                if not is_part_of_ring(r, y):
-                    continue
-                part['nitro'].append(y)
-        if part['phenol'] and part['nitro']:
-            atomlist_ring.append(set(atom_indices_ring(r, mol) +
-                                     atom_indices_group(part['phenol']) +
-                                     atom_indices_group(part['nitro'])))
-            atomlist_nitrophenol += part['phenol']
-    # returning of atomlist_ring is optional
-    # but the phenol groups are what are really counted so this is what is returned
+    for r, arom in enumerate(index.aromatic):
+        if not arom or r not in nitrorings:
+            continue
+        atomlist_nitrophenol += [x for x, rings in zip(_phenol,phenolrings) if r in rings]
+    # the phenol groups are what are counted so this is what is returned
     return atomlist_nitrophenol
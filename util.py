@@ -25,15 +25,22 @@
 ##
 ################################################################################
 
-import pybel
 import re
 import sys
-import pandas as pd
-import numpy as np
+import ast
+import operator
 from collections import OrderedDict
-from operator import add
 import os
+import molstore
 from functools import reduce
+from itertools import chain
+from tableio import tableformat, readtable
+from prefilter import patternfilter
+from lazyimport import lazyimport
+
+pybel = lazyimport('pybel')
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 # https://mathieularose.com/function-composition-in-python/
 def compose(*functions):
@@ -47,15 +54,243 @@ except:
 # if os.path.exists(userfile):
 #     execfile(userfile,globals())
 
-class searchgroups:
+###_* --- Expressions of groups
+
+## closures evaluating an expression over columns (arrays) of counts, built
+##   from its syntax tree (names are the variables of the expression). Only
+##   arithmetic, comparisons, boolean operators, conditional expressions and
+##   abs/round/min/max are vectorized; for other expressions (e.g., calls to
+##   userdef.py) vectorize() returns None. Rows for which any intermediate
+##   value is not finite (e.g., division by zero, for which python raises an
+##   error) are flagged in env['__invalid__'] to be evaluated by python.
+_binops = {ast.Add:operator.add, ast.Sub:operator.sub, ast.Mult:operator.mul,
+           ast.Div:getattr(operator,'div',operator.truediv), ast.FloorDiv:operator.floordiv,
+           ast.Mod:operator.mod, ast.Pow:operator.pow}
+_cmpops = {ast.Eq:operator.eq, ast.NotEq:operator.ne, ast.Lt:operator.lt,
+           ast.LtE:operator.le, ast.Gt:operator.gt, ast.GtE:operator.ge}
+_unaryops = {ast.USub:operator.neg, ast.UAdd:operator.pos,
+             ast.Not:lambda x: np.logical_not(_truth(x))}
+_functions = {'abs':lambda x: np.abs(x), 'round':lambda x: np.round(x),
+              'min':lambda *x: reduce(np.minimum,x),
+              'max':lambda *x: reduce(np.maximum,x)}
+_constants = tuple(getattr(ast,k) for k in ['Constant','Num'] if k in vars(ast))
+
+def _truth(x):
+    return np.asarray(x)!=0
+
+def vectorize(node,names):
+    fn = _vectorize(node,names)
+    if fn is None:
+        return None
+    def tracked(env):
+        value = fn(env)
+        env['__invalid__'] |= ~np.isfinite(value)
+        return value
+    return tracked
+
+def _vectorize(node,names):
+    if isinstance(node,_constants):
+        value = node.value if hasattr(node,'value') else node.n
+        if isinstance(value,(int,float)):
+            return lambda env: value
+    elif isinstance(node,ast.Name) and node.id in ('True','False'): # python 2
+        value = node.id=='True'
+        return lambda env: value
+    elif isinstance(node,ast.Name) and node.id in names:
+        name = node.id
+        return lambda env: env[name]
+    elif isinstance(node,ast.BinOp) and type(node.op) in _binops:
+        op, left, right = _binops[type(node.op)], vectorize(node.left,names), vectorize(node.right,names)
+        if left and right:
+            return lambda env: op(left(env),right(env))
+    elif isinstance(node,ast.UnaryOp) and type(node.op) in _unaryops:
+        op, operand = _unaryops[type(node.op)], vectorize(node.operand,names)
+        if operand:
+            return lambda env: op(operand(env))
+    elif isinstance(node,ast.Compare) and all(type(x) in _cmpops for x in node.ops):
+        ops = [_cmpops[type(x)] for x in node.ops]
+        operands = [vectorize(x,names) for x in [node.left]+node.comparators]
+        if all(operands):
+            def compare(env):
+                values = [x(env) for x in operands]
+                return reduce(np.logical_and,[op(a,b) for op, a, b in
+                                              zip(ops,values[:-1],values[1:])])
+            return compare
+    elif isinstance(node,ast.BoolOp):
+        values = [vectorize(x,names) for x in node.values]
+        if all(values):
+            ## python semantics: and/or return one of their operands
+            if isinstance(node.op,ast.And):
+                select = lambda a, b: np.where(_truth(a),b,a)
+            else:
+                select = lambda a, b: np.where(_truth(a),a,b)
+            return lambda env: reduce(select,[x(env) for x in values])
+    elif isinstance(node,ast.IfExp):
+        test, body, orelse = vectorize(node.test,names), vectorize(node.body,names), vectorize(node.orelse,names)
+        if test and body and orelse:
+            return lambda env: np.where(_truth(test(env)),body(env),orelse(env))
+    elif (isinstance(node,ast.Call) and isinstance(node.func,ast.Name) and
+          node.func.id in _functions and not node.keywords and
+          not getattr(node,'starargs',None) and not getattr(node,'kwargs',None)):
+        fn, args = _functions[node.func.id], [vectorize(x,names) for x in node.args]
+        if all(args) and (node.func.id!='round' or len(args)==1):
+            return lambda env: fn(*[x(env) for x in args])
+    return None
+
+def codenames(code):
+    ## names referenced by code and by code nested in it (lambdas,
+    ##   comprehensions), including free variables
+    names = set(code.co_names) | set(code.co_freevars)
+    for const in code.co_consts:
+        if hasattr(const,'co_names'):
+            names |= codenames(const)
+    return names
+
+class groupexpr:
+
+    ## expression of other groups (referenced as {name}), compiled once.
+    ##   References are replaced by variables _0_, _1_, ... which are bound
+    ##   to values of the referenced groups (counts, or sets of matched atoms)
+    ##   when evaluated; the expression may also refer to molecule and
+    ##   userdef functions.
+
+    def __init__(self,expr,pattern):
+        self.expr = expr
+        self.names = []
+        for name in pattern.findall(expr):
+            if name not in self.names:
+                self.names.append(name)
+        self.variables = ['_{:d}_'.format(i) for i in range(len(self.names))]
+        lookup = dict(zip(self.names,self.variables))
+        source = pattern.sub(lambda m: lookup[m.group(1)],expr)
+        source = re.sub('^eval[ ]','',source.strip()) # eval keyword is optional
+        self.code = compile(source,'<{}>'.format(expr),'eval')
+        self.vector = vectorize(ast.parse(source,mode='eval').body,self.variables)
+        self.usesmolecule = bool(codenames(self.code) & set(['molecule','mol']))
+        self.nested = any(hasattr(x,'co_names') for x in self.code.co_consts)
+
+    def evaluate(self,values,mol=None,namespace=None):
+        ## values is a mapping of group names to values; namespace replaces
+        ##   the globals of this module (e.g., with userdef functions timed)
+        env = dict(zip(self.variables,[values[name] for name in self.names]))
+        if self.usesmolecule:
+            env.update(molecule=mol,mol=mol)
+        scope = globals() if namespace is None else namespace
+        if self.nested:
+            ## nested scopes (lambdas, comprehensions) see bound names as
+            ##   globals, as they did in python 2
+            scope = dict(scope)
+            scope.update(env)
+        return eval(self.code,scope,env)
+
+    def evaluatecolumns(self,columns,nrows):
+        ## columns is a mapping of group names to arrays of length nrows;
+        ##   returns an array of values which is NaN for rows to be evaluated
+        ##   by evaluate() (all rows if the expression is not vectorized)
+        result = np.repeat(np.nan,nrows)
+        if self.vector is None:
+            return result
+        env = dict(zip(self.variables,[columns[name] for name in self.names]))
+        env['__invalid__'] = np.zeros(nrows,dtype=bool)
+        try:
+            with np.errstate(all='ignore'):
+                values = np.broadcast_to(np.asarray(self.vector(env),dtype=float),(nrows,))
+        except Exception:
+            return result
+        valid = ~env['__invalid__'] & np.isfinite(values)
+        result[valid] = values[valid]
+        return result
+
+class patternset:
+
+    ## compiled form of a table of patterns: SMARTS objects, code objects of
+    ##   expressions (eval keyword, bracketed and quoted expressions), order
+    ##   of evaluation of bracketed expressions and necessary conditions for
+    ##   SMARTS patterns to match (prefilter.py) are computed once and reused
+    ##   for every molecule
 
-    def __init__(self,groups, include=None):
+    evalkw = re.compile("^eval[ ]([^{}]+)")     # added 17.06.2015
+    brackets = re.compile("(?<!')\{([^{}]*)\}") # negative lookahead added 17.06.2015
+    quotes = re.compile("'\{([^{}]*)\}")        # added 17.06.2015
+    unquote = staticmethod(lambda x: x.replace("}","}'"))
+
+    def __init__(self,groups):
         self.groups = groups
+        haskw, hasbracket, hasquote = self.matchedpatt(groups)
+        self.haskw = haskw
+        self.hasbracket = hasbracket
+        self.hasquote = hasquote
+        ## SMARTS patterns
+        self.smarts = OrderedDict(
+            (key, pybel.Smarts(groups[key]))
+            for key in groups.index[~haskw & ~hasbracket & ~hasquote])
+        self.prefilter = patternfilter(OrderedDict(
+            (key, groups[key]) for key in self.smarts))
+        ## eval keyword
+        self.evalexpr = OrderedDict(
+            (key, groupexpr(self.evalkw.search(groups[key]).group(1),self.brackets))
+            for key in groups.index[haskw])
+        ## quoted expressions (patterns substituted as strings)
+        self.quotedexpr = OrderedDict(
+            (key, groupexpr(self.unquote(groups[key]).format(**groups),self.brackets))
+            for key in groups.index[hasquote])
+        ## bracketed expressions, in order of dependency
+        self.orderedexpr = self.__orderexpr(groups,hasbracket,self.brackets)
+        self.bracketexpr = OrderedDict(
+            (key, groupexpr(groups[key],self.brackets))
+            for key in self.orderedexpr)
+
+    def matchedpatt(self,groups):
+        return (groups.map(compose(bool,self.evalkw.search,str)),
+                groups.map(compose(bool,self.brackets.search,str)),
+                groups.map(compose(bool,self.quotes.search,str)))
+
+    @staticmethod
+    def __orderexpr(groups,hasbracket,brackets):
+        ## bracketed expressions ordered such that each follows the
+        ##   expressions it refers to (depth-first topological sort of the
+        ##   dependency graph); undefined groups and cycles are reported
+        ##   when the patterns are read
+        defined = set(groups.index)
+        remaining = groups.index[hasbracket].tolist()
+        tokensdict = {grp:brackets.findall(groups[grp]) for grp in remaining}
+        for grp in remaining:
+            undefined = [x for x in tokensdict[grp] if x not in defined]
+            if undefined:
+                sys.exit('"{}" uncomputable: "{}" undefined'.format(grp, ','.join(undefined)))
+        ordered = []
+        visited = set()
+        def visit(grp,path):
+            if grp in path:
+                cycle = path[path.index(grp):]+[grp]
+                sys.exit('"{}" uncomputable: cyclic reference "{}"'.format(grp, '" -> "'.join(cycle)))
+            if grp in visited or grp not in tokensdict:
+                return
+            for token in tokensdict[grp]:
+                visit(token,path+[grp])
+            visited.add(grp)
+            ordered.append(grp)
+        for grp in remaining:
+            visit(grp,[])
+        return ordered
+
+class searchgroups:
+
+    def __init__(self,groups, include=None, store=None, profile=None):
+        ## profile (profiling.searchprofile) records time, calls and matches
+        ##   of each pattern
         self.include = include
-        self.evalkw = re.compile("^eval[ ]([^{}]+)")     # added 17.06.2015
-        self.brackets = re.compile("(?<!')\{([^{}]*)\}") # negative lookahead added 17.06.2015
-        self.quotes = re.compile("'\{([^{}]*)\}")        # added 17.06.2015
-        self.unquote = lambda x: x.replace("}","}'")
+        self.store = store if store is not None else molstore.default
+        self.patterns = groups if isinstance(groups,patternset) else patternset(groups)
+        self.profile = profile
+        self.used = None # groups included in matchatoms, in order
+        if profile is not None:
+            self.patterns, self.store = profile.wrap(self.patterns,self.store)
+        self.groups = self.patterns.groups
+        self.evalkw = self.patterns.evalkw
+        self.brackets = self.patterns.brackets
+        self.quotes = self.patterns.quotes
+        self.unquote = self.patterns.unquote
 
     def commonattr(self):
         return (self.groups,
@@ -66,69 +301,81 @@ class searchgroups:
                 self.unquote)
 
     def matchedpatt(self,groups):
-        return (groups.map(compose(bool,self.evalkw.search,str)),
-                groups.map(compose(bool,self.brackets.search,str)),
-                groups.map(compose(bool,self.quotes.search,str)))
+        return self.patterns.matchedpatt(groups)
 
     def count(self,smilesstr):
         ##
+        return self.countmany([smilesstr])[0]
+
+    def countmany(self,smileslist):
+        ## counts for each SMILES string: SMARTS patterns and eval keyword and
+        ##   quoted expressions are evaluated for each molecule, bracketed
+        ##   expressions for the columns of counts of all molecules at once
         groups, include, evalkw, brackets, quotes, unquote = self.commonattr()
-        haskw, hasbracket, hasquote = self.matchedpatt(groups)
+        patterns = self.patterns
         if include is None:
             include = [True]*len(groups)
+        smileslist = list(smileslist)
+        nrows = len(smileslist)
         ##
-        mol = pybel.readstring('smi',smilesstr)
-        mol.addh()
-        molecule = mol # copy reference; keyword for userdef.py 29.09.2015
-        abundances = pd.Series([np.nan]*len(groups),index=groups.index)
-        ## SMARTS search
-        for key in groups.index[~haskw & ~hasbracket & ~hasquote]:
-            abundances[key] = len(pybel.Smarts(groups[key]).findall(mol))
-        ## evaluate eval keyword
-        for key in groups.index[haskw]: # untested
-            abundances[key] = round(eval(evalkw.search(groups[key]).group(1)))
-        ## evaluated quoted expressions
-        for key in groups.index[hasquote]: # untested
-            abundances[key] = round(eval(unquote(groups[key]).format(**groups)))
+        position = dict(zip(groups.index,range(len(groups))))
+        abundances = np.repeat(np.nan,nrows*len(groups)).reshape(nrows,len(groups))
+        for i, smilesstr in enumerate(smileslist):
+            mol = self.store.get(smilesstr)
+            row = abundances[i]
+            ## SMARTS search (patterns which cannot match are skipped)
+            impossible = patterns.prefilter.impossible(mol)
+            for key, smarts in patterns.smarts.items():
+                row[position[key]] = 0 if key in impossible else len(smarts.findall(mol))
+            ## evaluate eval keyword and quoted expressions
+            for key, expr in chain(patterns.evalexpr.items(),patterns.quotedexpr.items()):
+                row[position[key]] = round(expr.evaluate({},mol))
         ## evaluate expressions
-        orderedexpr = self.__orderexpr(groups,hasbracket,brackets)
-        for key in orderedexpr: #groups.index[hasbracket]:
-            abundances[key] = round(eval(groups[key].format(**abundances)))
+        columns = {key:abundances[:,j] for key, j in position.items()}
+        for key, expr in patterns.bracketexpr.items():
+            values = expr.evaluatecolumns(columns,nrows)
+            for i in np.flatnonzero(np.isnan(values)):
+                row = {name:float(columns[name][i]) for name in expr.names}
+                mol = self.store.get(smileslist[i]) if expr.usesmolecule else None
+                values[i] = round(expr.evaluate(row,mol))
+            columns[key][:] = np.round(values)
         ##
-        return abundances[include].astype(int)
+        selected = pd.Series(range(len(groups)),index=groups.index)[include]
+        counts = abundances[:,selected.values].astype(int)
+        return [pd.Series(row,index=selected.index) for row in counts]
 
     def matchatoms(self,smilesstr):
         ##
         groups, include, evalkw, brackets, quotes, unquote = self.commonattr()
-        haskw, hasbracket, hasquote = self.matchedpatt(groups)
+        patterns = self.patterns
         ##
-        mol = pybel.readstring('smi',smilesstr)
-        mol.addh()
-        molecule = mol # copy reference; keyword for userdef.py 29.09.2015
+        mol = self.store.get(smilesstr)
         tups = OrderedDict(zip(groups.index,[None]*len(groups)))
-        ## SMARTS search
-        for key in groups.index[~haskw & ~hasbracket & ~hasquote]:
-            tups[key] = set(pybel.Smarts(groups[key]).findall(mol))
+        ## SMARTS search (patterns which cannot match are skipped)
+        impossible = patterns.prefilter.impossible(mol)
+        for key, smarts in patterns.smarts.items():
+            tups[key] = set() if key in impossible else set(smarts.findall(mol))
         ## evaluate eval keyword
-        for key in groups.index[haskw]:
-            tups[key] = eval(evalkw.search(groups[key]).group(1))
+        for key, expr in patterns.evalexpr.items():
+            tups[key] = expr.evaluate({},mol)
         ## evaluate quoted expressions
-        for key in groups.index[hasquote]: # untested
-            tups[key] = self.__substitute(mol,groups[key],quotes,groups)
-        ## evaluate expressions
-        orderedexpr = self.__orderexpr(groups,hasbracket,brackets)
-        for key in orderedexpr: #groups.index[hasbracket]
-            tups[key] = self.__substitute(mol,groups[key],brackets,tups)
-        usetups = OrderedDict([(k,v) for (k,v) in tups.items() if include.ix[k]])
-        alltups = reduce(set.union,usetups.values())
-        allatoms = reduce(add,map(list,alltups),[])
-        atomicmass = set([(atom.type,atom.atomicmass) for atom in mol.atoms
-                          if atom.idx in allatoms])
+        for key, expr in patterns.quotedexpr.items(): # untested
+            tups[key] = expr.evaluate({},mol)
+        ## evaluate expressions (set operations)
+        for key, expr in patterns.bracketexpr.items():
+            tups[key] = expr.evaluate(tups,mol)
+        if self.used is None:
+            use = include.to_dict()
+            self.used = [k for k in tups.keys() if use[k]]
+        usetups = OrderedDict([(k,tups[k]) for k in self.used])
+        ## atoms in any match, as a boolean mask over atom indices (from 1)
+        atoms = mol.atoms
+        atomtype = [atom.type for atom in atoms]
+        inmatch = np.zeros(len(atoms),dtype=bool)
+        inmatch[np.fromiter(chain.from_iterable(chain.from_iterable(usetups.values())),dtype=int)-1] = True
+        atomicmass = set([(atomtype[i],atoms[i].atomicmass) for i in np.flatnonzero(inmatch)])
         ##
-        idxlabel = 'atom'
-        atomtype = pd.DataFrame([(atom.idx,atom.type) for atom in mol.atoms],
-                                columns=[idxlabel,'type']).set_index(idxlabel)
-        matched = self.__atomtable(atomtype,usetups)
+        matched = self.__atomtable(atomtype,usetups,inmatch)
         ##
         return (matched, atomicmass)
         # self.atomicmass += atomicmass
@@ -138,74 +385,126 @@ class searchgroups:
         # mass = sum([atom.atomicmass for atom in mol.atoms if atom.idx in allatomidx])
         # return mass
 
-    @staticmethod
-    def __substitute(mol,eq,pattern,env):
-        variables = pattern.findall(eq)
-        br = {}
-        for idx,var in enumerate(variables):
-            newvar = '_{}_'.format(idx)
-            br[newvar] = env[var]
-            eq = eq.replace('{{{}}}'.format(var),newvar)
-        return eval(eq,br)
-
-    @staticmethod
-    def __orderexpr(groups,hasbracket,brackets):
-        ##
-        prepended = lambda x,y: [x]+y
-        ##
-        computable = set(prepended('',groups.index.tolist()))
-        computed = set(prepended('',groups.index[~hasbracket].tolist()))
-        remaining = groups.index[hasbracket].tolist()
-        tokensdict = {grp:set(brackets.findall(groups[grp])) for grp in remaining}
-        ##
-        maxiter = len(groups)*10 # to break out if stuck for some reason
-        ordered = []
-        i = 0
-        while len(remaining) > 0:
-            grp = remaining.pop(0)
-            tokens = tokensdict[grp]
-            if not tokens.issubset(computable):
-                undefined = ','.join(list(tokens-computable))
-                sys.exit('"{}" uncomputable: "{}" undefined'.format(grp, undefined))
-            ##
-            if tokens.issubset(computed):
-                computed = computed.union([grp])
-                ordered.append(grp)
-            else:
-                remaining.append(grp)
-            ##
-            i += 1
-            if i > maxiter:
-                print('remaining:', ','.join(remaining))
-                sys.exit('exceeded maximum number of iterations {:d}'.format(maxiter))
-        return ordered
+    def batch(self,method,smileslist):
+        ## results of method ('count' or 'matchatoms') for each SMILES string
+        if method=='count':
+            return self.countmany(smileslist)
+        fn = getattr(self,method)
+        return [fn(x) for x in smileslist]
 
     @staticmethod
-    def __atomtable(atomtype,tuplist):
-        ## create a table from atomtypes and matched items
-        idxlabel = atomtype.index.name
-        atomtype.reset_index(inplace=True)
-        columns = atomtype.columns.tolist()+['match','group']
-        dflist = []
+    def __atomtable(atomtype,tuplist,inmatch):
+        ## create a table from atomtypes (listed in order of atom index,
+        ##   starting from 1), matched items and the mask of atoms in any
+        ##   match. The table is returned as columns (OrderedDict of arrays)
+        ##   and is ordered by atom and, for each atom, by match; atoms not in
+        ##   any match have a single row with missing match and group (as for
+        ##   an outer join on atom)
+        matchatom, matchid, matchgroup = [], [], []
         i = 1
         for group, tups in tuplist.items():
             for elem in tups: # 2015.08.13 edit
-                groupdf = pd.DataFrame(list(elem),columns=[idxlabel])
-                groupdf['match'] = i
-                groupdf['group'] = group
-                dflist.append(groupdf)
+                matchatom.extend(elem)
+                matchid.extend([i]*len(elem))
+                matchgroup.extend([group]*len(elem))
                 i += 1
-            # if len(tup)==0:
-            #     continue
-            # allatoms = reduce(add,map(list,tup),[])
-            # groupdf = pd.DataFrame(allatoms,columns=[idxlabel])
-            # groupdf['match'] = i
-            # groupdf['group'] = group
-            # dflist.append(groupdf)
-            # i += 1
-        if len(dflist)==0:
-            out = pd.DataFrame(columns=columns)
-        else:
-            allgroupdf = pd.concat(dflist)
-            out = atomtype.merge(allgroupdf,on=idxlabel,how='outer')[columns]
-        return out
+        if len(matchatom)==0:
+            return OrderedDict([('atom',np.array([],dtype=int)),
+                                ('type',np.array([],dtype=object)),
+                                ('match',np.array([],dtype=int)),
+                                ('group',np.array([],dtype=object))])
+        position = np.asarray(matchatom,dtype=int)-1
+        unmatched = np.flatnonzero(~inmatch)
+        position = np.concatenate([position,unmatched])
+        order = np.argsort(position,kind='mergesort') # stable: keeps match order
+        position = position[order]
+        match = np.asarray(matchid,dtype=int)
+        group = np.empty(len(position),dtype=object)
+        group[:len(matchgroup)] = matchgroup
+        if len(unmatched) > 0:
+            match = np.concatenate([match,np.repeat(np.nan,len(unmatched))])
+            group[len(matchgroup):] = np.nan
+        return OrderedDict([('atom',position+1),
+                            ('type',np.asarray(atomtype,dtype=object)[position]),
+                            ('match',match[order]),
+                            ('group',group[order])])
+
+###_* --- Batch processing
+
+## worker processes hold their own compiled searchgroups (pybel objects
+##   cannot be pickled); it is created once per process by the initializer.
+##   Profiles of workers are returned with the results of each chunk.
+_worker = {}
+
+def _initworker(groups,include,profile=False):
+    if profile:
+        from profiling import searchprofile
+        profile = searchprofile()
+    _worker['search'] = searchgroups(groups,include,profile=profile or None)
+
+def _searchchunk(args):
+    method, chunk = args
+    search = _worker['search']
+    results = search.batch(method,chunk)
+    return results, (search.profile.pop() if search.profile is not None else None)
+
+def chunked(seq,size):
+    return [seq[i:i+size] for i in range(0,len(seq),size)]
+
+def numjobs(jobs):
+    from multiprocessing import cpu_count
+    return jobs if jobs and jobs > 0 else cpu_count()
+
+def searchpool(search,jobs):
+    ## pool of worker processes, to be reused across calls to mapsearch
+    from multiprocessing import Pool
+    return Pool(numjobs(jobs),initializer=_initworker,
+                initargs=(search.groups,search.include,search.profile is not None))
+
+def mapsearch(search,method,smiles,jobs=1,chunksize=None,pool=None):
+    ## apply search.<method> ('count' or 'matchatoms') to each SMILES string;
+    ##   with jobs > 1 (0 for all cores), chunks of the input are distributed
+    ##   to worker processes. Results are returned in input order.
+    smiles = list(smiles)
+    jobs = numjobs(jobs)
+    if (jobs == 1 and pool is None) or len(smiles) <= 1:
+        return search.batch(method,smiles)
+    if not chunksize:
+        chunksize = max(1,int(np.ceil(len(smiles)/float(jobs*4))))
+    tasks = [(method,chunk) for chunk in chunked(smiles,chunksize)]
+    workers = pool or searchpool(search,min(jobs,len(tasks)))
+    try:
+        results = workers.map(_searchchunk,tasks)
+    finally:
+        if pool is None:
+            workers.close()
+            workers.join()
+    for _, records in results:
+        if records is not None and search.profile is not None:
+            search.profile.merge(records)
+    return list(chain.from_iterable(x for x, _ in results))
+
+###_* --- Input
+
+def readinput(filename,chunksize=None):
+    ## read file of SMILES strings (compound, SMILES) with duplicate rows
+    ##   removed. With chunksize, tables of at most chunksize rows are read
+    ##   one at a time; duplicates are tracked across chunks by 64-bit row
+    ##   hashes so that only these are retained in memory. parquet and
+    ##   feather files (by extension) are read whole and then chunked.
+    if not chunksize:
+        yield readtable(filename).drop_duplicates().set_index('compound')
+        return
+    if tableformat(filename)=='csv':
+        chunks = pd.read_csv(filename,chunksize=chunksize)
+    else:
+        table = readtable(filename)
+        chunks = (table.iloc[i:i+chunksize] for i in range(0,len(table),chunksize))
+    seen = set()
+    for chunk in chunks:
+        chunk = chunk.drop_duplicates()
+        hashed = pd.util.hash_pandas_object(chunk,index=False).values
+        isnew = np.array([h not in seen for h in hashed],dtype=bool)
+        seen.update(hashed[isnew])
+        if isnew.any():
+            yield chunk.loc[isnew].set_index('compound')
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+################################################################################
+##
+## validation_counts.py
+## Author: Satoshi Takahama (satoshi.takahama@epfl.ch)
+## Oct. 2026
+##
+## -----------------------------------------------------------------------------
+##
+## This file is part of APRL-SSP
+##
+## APRL-SSP is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## APRL-SSP is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with APRL-SSP.  If not, see <http://www.gnu.org/licenses/>.
+##
+################################################################################
+
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from substructure_generate_fulltable import counttables, formatcounts
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+
+###_* --- Define command-line arguments
+
+parser = ArgumentParser(description='''
+============================================================
+Regression check of count tables of substructure_generate_fulltable.py. For
+each prefix in filelist_atoms.csv, atom and group counts are recomputed from
+{prefix}_MCMgroups_atomfulltable.csv and compared (byte for byte) with
+{prefix}_MCMgroups_atomcounts.csv and {prefix}_MCMgroups_groupcounts.csv.
+Exits with status 1 if any file differs. Example usage:
+
+$ python validation_counts.py -v validation
+
+''',formatter_class=RawTextHelpFormatter)
+
+###_ . Arguments
+
+parser.add_argument('-v','--validation-directory',type=str,
+                    default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'validation'),
+                    help='directory with filelist_atoms.csv and validation files')
+
+countfiles = {'atoms':'atomcounts','groups':'groupcounts'}
+
+if __name__=='__main__':
+
+###_* --- Parse arguments
+
+    args = parser.parse_args()
+    vdirectory = args.validation_directory
+
+    with open(os.path.join(vdirectory,'filelist_atoms.csv')) as f:
+        prefixlist = f.read().strip().split()
+
+###_* --- Compare
+
+    ndiff = 0
+    for prefix in prefixlist:
+        filename = os.path.join(vdirectory,prefix+'{}.csv')
+        index = pd.read_csv(filename.format('')).drop_duplicates().set_index('compound').index
+        master = pd.read_csv(filename.format('_MCMgroups_atomfulltable'))
+        tables = counttables(master,index)
+        for k, name in countfiles.items():
+            with open(filename.format('_MCMgroups_'+name)) as f:
+                reference = f.read()
+            widef = formatcounts(tables[k],tables[k].columns)
+            same = widef.to_csv(index_label='compound')==reference
+            print('{} {}: {}'.format(prefix,name,'same' if same else 'DIFFERENT'))
+            ndiff += not same
+
+    sys.exit(1 if ndiff else 0)
@@ -28,10 +28,13 @@
 
 import os
 import re
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 from argparse import ArgumentParser, RawTextHelpFormatter
+from tableio import readtable
+from atomindex import readatomtable, readcompounds
+from lazyimport import lazyimport
+
+pd = lazyimport('pandas')
+np = lazyimport('numpy')
 
 ## -----------------------------------------------------------------------------
 
@@ -48,11 +51,13 @@ $ python validation_triple.py -f apinene_MCMgroups_atomfulltable.csv -a apinene_
 ## Arguments
 
 parser.add_argument('-f','--atomfulltable',type=str,
-                    help='file generated by substructure_generate_fulltable.py; csv format')
+                    help='file generated by substructure_generate_fulltable.py; csv, parquet, feather or atom index (.bin) format')
 parser.add_argument('-a','--atomcommon',type=str,
-                    help='file generated by substructure_seach.py with common_atoms.csv patterns; csv format')
+                    help='file generated by substructure_seach.py with common_atoms.csv patterns; csv, parquet or feather format')
 parser.add_argument('-o','--outputprefix',type=str,default='output',
                     help='output prefix')
+parser.add_argument('-c','--compounds',type=str,
+                    help='text file with list of compounds to validate in a single column (default: all)')
 
 
 if __name__=='__main__':
@@ -64,6 +69,8 @@ if __name__=='__main__':
     # args = parser.parse_args('-f ssp/apinene_MCMgroups_atomfulltable.csv -a ssp/apinene_commonatoms.csv -o apinene'.split())
     args = parser.parse_args()
 
+    import matplotlib.pyplot as plt
+
     filename = {
      'fulltable':args.atomfulltable,
      'atoms':args.atomcommon
@@ -82,13 +89,16 @@ if __name__=='__main__':
         except:
             return np.nan
     
-    atoms = pd.read_csv(filename['atoms']).set_index('compound')
+    compounds = readcompounds(args.compounds) if args.compounds else None
+
+    atoms = readtable(filename['atoms']).set_index('compound')
     atoms.columns = atoms.columns.map(atype)
+    if compounds is not None:
+        atoms = atoms.loc[atoms.index.isin(compounds)]
 
-    fulltable = pd.read_csv(filename['fulltable'])
-    fulltable['atype'] = (
-        fulltable['type'].map(atype)
-        .astype('category', categories=atoms.columns)
+    fulltable = readatomtable(filename['fulltable'],compounds)
+    fulltable['atype'] = pd.Categorical(
+        fulltable['type'].map(atype), categories=atoms.columns
         )
 
     ## -------------------------------------------------------------------------
@@ -101,8 +111,9 @@ if __name__=='__main__':
         fulltable
         .loc[ismatched, ['compound', 'atom', 'atype']]
         .drop_duplicates()
-        .groupby(['compound', 'atype'])['atom'].count()
+        .groupby(['compound', 'atype'],observed=True)['atom'].count()
         .unstack(level='atype', fill_value=0)
+        .reindex(columns=atoms.columns, fill_value=0)
         )
 
     ## -------------------------------------------------------------------------
@@ -110,7 +121,7 @@ if __name__=='__main__':
     ## FG specificity (groups per atom)
 
     groupv = (
-        fulltable.groupby(['compound', 'atom', 'atype'])['match'].count()
+        fulltable.groupby(['compound', 'atom', 'atype'],observed=True)['match'].count()
         .reset_index('atype')
         )
 
@@ -123,7 +134,7 @@ if __name__=='__main__':
 
     carbonv = (
         fulltable.loc[fulltable['atype']=='C']
-        .groupby(['compound', 'group', 'match'])['atom'].count()
+        .groupby(['compound', 'group', 'match'],observed=True)['atom'].count()
         .reset_index('group')
         )
 